@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6.QtCore import QObject, QTimer, qDebug
+
+POLL_INTERVAL = 10  # in miliseconds
+
+
+class BackgroundTasks(QObject):
+    """
+    Runs functions in a pool of worker threads and hands their results to
+    callbacks on the GUI thread. The workers never touch Qt objects owned by
+    the GUI thread nor emit signals; finished tasks are collected by a timer
+    that only runs while tasks are pending.
+    """
+
+    def __init__(self, max_workers=None, parent=None):
+        super().__init__(parent)
+        self.executor = ThreadPoolExecutor(max_workers)
+        self.pending = []
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(POLL_INTERVAL)
+        self.timer.timeout.connect(self.collect)
+
+    def submit(self, callback, function, *args):
+        future = self.executor.submit(function, *args)
+        self.pending.append((future, callback))
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def collect(self):
+        finished = [(future, callback) for future, callback in self.pending if future.done()]
+        self.pending = [(future, callback) for future, callback in self.pending if not future.done()]
+        if not self.pending:
+            self.timer.stop()
+
+        for future, callback in finished:
+            if future.cancelled():
+                continue
+            error = future.exception()
+            if error is not None:
+                qDebug("background task failed: {}".format(error))
+                continue
+            callback(future.result())
+
+    def shutdown(self):
+        self.timer.stop()
+        for future, _ in self.pending:
+            future.cancel()
+        self.pending = []
+        self.executor.shutdown(wait=False)
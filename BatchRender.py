@@ -0,0 +1,310 @@
+import os
+import argparse
+from collections import deque
+
+from PySide6.QtCore import QObject, QCoreApplication, QSettings, QElapsedTimer, QThread, Qt, qDebug
+
+from Dependencies import DependencyGraph
+from FileCache import FileCache, FileCacheItem
+from RenderServer import RenderServer, parse_diagrams
+from SettingsConstants import *
+from Fingerprint import text_fingerprint
+from Utils import make_fingerprint_key, default_cache_path
+
+PLANTUML_EXTENSIONS = ('.puml', '.plantuml', '.pu', '.wsd')
+IMAGE_FORMATS = ('png', 'svg')
+DEFAULT_GROUP_SIZE = 50
+
+
+def find_documents(paths):
+    documents = []
+    for path in paths:
+        if os.path.isfile(path):
+            documents.append(os.path.abspath(path))
+            continue
+
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in PLANTUML_EXTENSIONS:
+                    documents.append(os.path.abspath(os.path.join(root, name)))
+
+    # Keeps the documents of a directory together, so the render servers
+    # rarely have to be restarted for a new working directory
+    documents.sort(key=lambda p: (os.path.dirname(p), p))
+    return documents
+
+
+def image_paths(document_path, output_dir, root, format_name, count):
+    """Image file names as PlantUML would write them: name.png, name_001.png, ..."""
+    base, _ = os.path.splitext(document_path)
+    if output_dir:
+        base = os.path.join(output_dir, os.path.relpath(base, root))
+
+    paths = ["%s.%s" % (base, format_name)]
+    paths.extend(["%s_%03d.%s" % (base, i, format_name) for i in range(1, count)])
+    return paths
+
+
+def write_if_changed(path, data):
+    data = bytes(data)
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except IOError:
+        pass
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+
+class BatchRenderer(QObject):
+    """
+    Renders a list of documents with a pool of RenderServer workers, each
+    running its own warm PlantUML process. Documents whose images are all
+    in the FileCache are written from the cache without rendering.
+
+    Up to group_size documents of the same directory are streamed to a
+    worker at once, so PlantUML never waits for the next document.
+    """
+
+    def __init__(self, documents, root, output_dir, format_name, cache, workers,
+                 group_size=DEFAULT_GROUP_SIZE, parent=None):
+        super().__init__(parent)
+        self.queue = deque(documents)
+        self.root = root
+        self.output_dir = output_dir
+        self.format_name = format_name
+        self.cache = cache
+        self.workers = workers
+        self.group_size = max(1, group_size)
+        self.servers = []
+        self.in_flight = {}
+        self.dependency_graph = DependencyGraph()
+
+        self.total = len(documents)
+        self.rendered = 0
+        self.from_cache = 0
+        self.up_to_date = 0
+        self.failed = 0
+        self.timer = QElapsedTimer()
+
+    def start(self, java_path, plantuml_path, timeouts):
+        self.timer.start()
+        for _ in range(max(1, min(self.workers, self.total))):
+            server = RenderServer(self)
+            server.configure(java_path, plantuml_path, self.format_name)
+            server.set_timeouts(*timeouts)
+            server.finished.connect(lambda key, images, s=server: self.on_finished(s, key, images))
+            # Queued, as submit_many() reports documents without diagram synchronously
+            server.failed.connect(lambda key, message, s=server: self.on_failed(s, key, message), Qt.QueuedConnection)
+            self.servers.append(server)
+
+        for server in self.servers:
+            self.feed(server)
+
+        self.check_done()
+
+    def feed(self, server):
+        group = []
+        while self.queue and len(group) < self.group_size:
+            path = self.queue[0]
+            if group and os.path.dirname(path) != os.path.dirname(group[0][0]):
+                break
+            self.queue.popleft()
+
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    document = f.read()
+            except (IOError, UnicodeDecodeError) as e:
+                print("{}: {}".format(path, e))
+                self.failed += 1
+                continue
+
+            # Only balanced documents share the pipe: a missing @end would shift
+            # the images of the documents streamed after it
+            diagrams, error = parse_diagrams(document)
+            if error is not None:
+                print("{}: {}".format(path, error))
+                self.failed += 1
+                continue
+            if not diagrams:
+                print("{}: no @start directive found".format(path))
+                self.failed += 1
+                continue
+
+            outputs = image_paths(path, self.output_dir, self.root, self.format_name, len(diagrams))
+            keys = [self.diagram_key(block, os.path.dirname(path)) for _, block in diagrams]
+            if self.write_from_cache(keys, outputs):
+                continue
+
+            group.append((path, document, outputs, keys))
+
+        if group:
+            self.in_flight[server] = group
+            # Documents are identified by their path in the render server
+            server.submit_many([(path, document) for path, document, _, _ in group],
+                               os.path.dirname(group[0][0]))
+
+    def diagram_key(self, block, directory):
+        """Cache key of a @start/@end block, the one the editor uses for the same diagram"""
+        dependencies = self.dependency_graph.fingerprint(block, directory)
+        return make_fingerprint_key(text_fingerprint(block), self.format_name, dependencies)
+
+    def pop_in_flight(self, server, path):
+        group = self.in_flight[server]
+        for i, entry in enumerate(group):
+            if entry[0] == path:
+                del group[i]
+                break
+        else:
+            entry = None
+
+        if not group:
+            del self.in_flight[server]
+        return entry
+
+    def write_from_cache(self, keys, outputs):
+        if self.cache is None:
+            return False
+
+        images = []
+        for key in keys:
+            item = self.cache.item(key)
+            data = item.data() if item is not None else None
+            if data is None:
+                return False
+            images.append(data)
+
+        written = False
+        for path, data in zip(outputs, images):
+            written = write_if_changed(path, data) or written
+
+        if written:
+            self.from_cache += 1
+        else:
+            self.up_to_date += 1
+        return True
+
+    def on_finished(self, server, path, images):
+        path, _, outputs, keys = self.pop_in_flight(server, path)
+        if len(images) != len(outputs):
+            # Images cannot be matched with their diagrams, none is written
+            print("{}: {} images rendered for {} diagrams".format(path, len(images), len(outputs)))
+            self.failed += 1
+            self.feed_if_idle(server)
+            return
+
+        for output, key, data in zip(outputs, keys, images):
+            write_if_changed(output, data)
+            if self.cache is not None:
+                self.cache.add_item(data, key, FileCacheItem)
+        self.rendered += 1
+        qDebug("rendered {}".format(path))
+
+        self.feed_if_idle(server)
+
+    def on_failed(self, server, path, message):
+        path, _, _, _ = self.pop_in_flight(server, path)
+        print("{}: {}".format(path, message))
+        self.failed += 1
+
+        self.feed_if_idle(server)
+
+    def feed_if_idle(self, server):
+        if server not in self.in_flight:
+            self.feed(server)
+        self.check_done()
+
+    def check_done(self):
+        if self.queue or self.in_flight:
+            return
+
+        for server in self.servers:
+            server.stop(True)
+        QCoreApplication.exit(1 if self.failed else 0)
+
+    def summary(self):
+        elapsed = self.timer.elapsed() / 1000.0
+        throughput = self.total / elapsed if elapsed > 0 else 0.0
+        return "{} documents in {:.2f} s ({:.1f} documents/s): " \
+               "{} rendered, {} written from cache, {} up to date, {} failed".format(
+                   self.total, elapsed, throughput, self.rendered, self.from_cache, self.up_to_date, self.failed)
+
+
+def read_settings():
+    settings = QSettings()
+    settings.beginGroup(SETTINGS_MAIN_SECTION)
+
+    java_path = SETTINGS_CUSTOM_JAVA_PATH_DEFAULT
+    if settings.value(SETTINGS_USE_CUSTOM_JAVA, SETTINGS_USE_CUSTOM_JAVA_DEFAULT, bool):
+        java_path = settings.value(SETTINGS_CUSTOM_JAVA_PATH, SETTINGS_CUSTOM_JAVA_PATH_DEFAULT)
+
+    plantuml_path = SETTINGS_CUSTOM_PLANTUML_PATH_DEFAULT
+    if settings.value(SETTINGS_USE_CUSTOM_PLANTUML, SETTINGS_USE_CUSTOM_PLANTUML_DEFAULT, bool):
+        plantuml_path = settings.value(SETTINGS_CUSTOM_PLANTUML_PATH, SETTINGS_CUSTOM_PLANTUML_PATH_DEFAULT)
+
+    cache_path = default_cache_path()
+    if settings.value(SETTINGS_USE_CUSTOM_CACHE, SETTINGS_USE_CUSTOM_CACHE_DEFAULT, bool):
+        cache_path = settings.value(SETTINGS_CUSTOM_CACHE_PATH, cache_path)
+    cache_max_size = int(settings.value(SETTINGS_CACHE_MAX_SIZE, SETTINGS_CACHE_MAX_SIZE_DEFAULT))
+
+    timeouts = (int(settings.value(SETTINGS_PROCESS_START_TIMEOUT, SETTINGS_PROCESS_START_TIMEOUT_DEFAULT)) * TIMEOUT_SCALE,
+                int(settings.value(SETTINGS_RENDER_TIMEOUT, SETTINGS_RENDER_TIMEOUT_DEFAULT)) * TIMEOUT_SCALE)
+
+    settings.endGroup()
+    return java_path, plantuml_path, cache_path, cache_max_size, timeouts
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="main.py --batch",
+                                     description="Render PlantUML documents without starting the editor")
+    parser.add_argument("paths", nargs="+", help="documents or directories to render")
+    parser.add_argument("-o", "--output", help="output directory (default: next to each document)")
+    parser.add_argument("-t", "--format", choices=IMAGE_FORMATS, default="png", help="image format")
+    parser.add_argument("-j", "--jobs", type=int, default=QThread.idealThreadCount(),
+                        help="number of PlantUML processes to run in parallel")
+    parser.add_argument("-g", "--group-size", type=int, default=DEFAULT_GROUP_SIZE,
+                        help="number of documents of a directory streamed to a PlantUML process at once")
+    parser.add_argument("--java", help="Java executable (default: from the editor preferences)")
+    parser.add_argument("--plantuml", help="plantuml.jar (default: from the editor preferences)")
+    parser.add_argument("--no-cache", action="store_true", help="render every document, ignoring the cache")
+    return parser.parse_args(argv)
+
+
+def run_batch(argv):
+    """Entry point of the headless mode, expects a QCoreApplication to exist"""
+    args = parse_arguments(argv)
+    java_path, plantuml_path, cache_path, cache_max_size, timeouts = read_settings()
+    java_path = args.java or java_path
+    plantuml_path = args.plantuml or plantuml_path
+
+    cache = None
+    if not args.no_cache:
+        cache = FileCache(cache_max_size, None)
+        cache.set_path(cache_path, FileCacheItem)
+
+    documents = find_documents(args.paths)
+    if not documents:
+        print("no PlantUML documents found")
+        return 0
+
+    # Images keep their path relative to the directory containing every input
+    directories = [os.path.abspath(path if os.path.isdir(path) else os.path.dirname(path)) for path in args.paths]
+    try:
+        root = os.path.commonpath(directories)
+    except ValueError:
+        print("the documents are on different drives, they cannot share an output directory")
+        return 1
+    output_dir = os.path.abspath(args.output) if args.output else None
+
+    renderer = BatchRenderer(documents, root, output_dir, args.format, cache, args.jobs, args.group_size)
+    renderer.start(java_path, plantuml_path, timeouts)
+    # start() exits right away when everything came from the cache
+    result = QCoreApplication.exec() if renderer.in_flight else (1 if renderer.failed else 0)
+
+    print(renderer.summary())
+    return result
@@ -0,0 +1,113 @@
+import os
+import re
+import hashlib
+
+INCLUDE_PATTERN = re.compile(r'^\s*!(?:include|include_many|include_once|includesub|import)\s+(.+?)\s*$',
+                             re.MULTILINE)
+
+
+def include_names(text):
+    """File names included by a PlantUML text, standard library and URL includes excluded"""
+    names = []
+    for match in INCLUDE_PATTERN.finditer(text):
+        name = match.group(1).strip('"')
+        if name.startswith("<") or "://" in name:
+            continue
+        # "file!id" and "file!index" select a part of the file
+        names.append(name.split("!", 1)[0])
+    return names
+
+
+def resolve_include(directory, name):
+    return os.path.normpath(os.path.join(directory, os.path.expanduser(name)))
+
+
+class DependencyFile:
+    def __init__(self, stamp, digest, includes):
+        self.stamp = stamp
+        self.digest = digest
+        self.includes = includes
+
+
+class DependencyGraph:
+    """
+    Include dependencies of PlantUML documents. Included files are read
+    again only when their modification time or size change, so computing
+    the dependencies of a document mostly costs a stat() per file.
+
+    Includes are resolved against the working directory for the document
+    itself and against the directory of the including file for nested ones.
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def file(self, path):
+        """DependencyFile of path, None if it cannot be read"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.files.pop(path, None)
+            return None
+
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        dependency = self.files.get(path)
+        if dependency is not None and dependency.stamp == stamp:
+            return dependency
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            self.files.pop(path, None)
+            return None
+
+        directory = os.path.dirname(path)
+        includes = [resolve_include(directory, name) for name in include_names(data.decode('utf-8', 'replace'))]
+        dependency = DependencyFile(stamp, hashlib.md5(data).hexdigest(), includes)
+        self.files[path] = dependency
+        return dependency
+
+    def dependencies(self, text, working_directory):
+        """
+        Transitive dependencies of text as a dict of path to content hash,
+        in include order. The hash of a missing file is None.
+        """
+        result = {}
+        queue = [resolve_include(working_directory, name) for name in include_names(text)]
+        while queue:
+            path = queue.pop(0)
+            if path in result:
+                continue
+
+            dependency = self.file(path)
+            result[path] = dependency.digest if dependency is not None else None
+            if dependency is not None:
+                queue.extend(dependency.includes)
+        return result
+
+    def fingerprint(self, text, working_directory):
+        """String identifying the current content of the dependencies of text, empty without any"""
+        return "\n".join("{} {}".format(path, digest)
+                         for path, digest in self.dependencies(text, working_directory).items())
+
+    def includes_any(self, text, working_directory, paths):
+        """Whether text directly includes one of paths"""
+        return any(resolve_include(working_directory, name) in paths for name in include_names(text))
+
+    def dependents(self, path):
+        """Known files including path, directly or not"""
+        path = os.path.normpath(path)
+        result = set()
+        queue = [path]
+        while queue:
+            included = queue.pop()
+            for candidate, dependency in self.files.items():
+                if included in dependency.includes and candidate not in result:
+                    result.add(candidate)
+                    queue.append(candidate)
+        return result
+
+    def forget(self, path):
+        """Drops what is known about path, it is read again on next use"""
+        self.files.pop(os.path.normpath(path), None)
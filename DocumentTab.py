@@ -0,0 +1,53 @@
+import os
+
+from Fingerprint import DocumentFingerprint
+from TextEdit import TextEdit
+
+
+class DocumentTab:
+    """
+    A document opened in a tab of the main window: its editor and what was
+    last shown of it. The render server and the caches are shared by all
+    the tabs, images are keyed by content so the tabs can share them too.
+    """
+
+    def __init__(self, parent):
+        self.editor = TextEdit(parent)
+        self.fingerprint = DocumentFingerprint(self.editor.document(), self.editor)
+        self.document_path = None
+        self.export_path = None
+        # (name, key, Diagram) of every diagram of the document
+        self.diagrams = []
+        self.current_diagram = 0
+        self.last_key = None
+        self.cached_image = None
+        self.needs_refresh = False
+        # Smoothed render time of the document, in miliseconds
+        self.render_time_estimate = 0
+
+    def name(self):
+        """File name of the document, None if it was never saved"""
+        if self.document_path is None:
+            return None
+        return os.path.basename(self.document_path)
+
+    def is_modified(self):
+        return self.editor.document().isModified()
+
+    def is_untouched(self):
+        """A new document nobody typed in, it can be replaced by an opened one"""
+        return self.document_path is None and not self.is_modified()
+
+    def working_directory(self):
+        """Directory PlantUML runs in, relative !include paths are resolved against it"""
+        if self.document_path is None:
+            return os.getcwd()
+        return os.path.dirname(os.path.abspath(self.document_path))
+
+    def current_diagram_key(self):
+        if not self.diagrams:
+            return None
+        return self.diagrams[self.current_diagram][1]
+
+    def has_diagram(self, key):
+        return any(key == diagram_key for _, diagram_key, _ in self.diagrams)
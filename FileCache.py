@@ -1,12 +1,202 @@
+import os
+import time
+from collections import OrderedDict
+
+from PySide6.QtCore import QObject, qDebug
+
+from Utils import is_cache_key
+
+TMP_SUFFIX = ".tmp"
+# in seconds, a younger temporary file may still be written by another instance
+STALE_TMP_AGE = 60
+
+
 class FileCacheItem:
     def __init__(self, path, key, cost, access_date, parent):
-        pass
+        self.path = path
+        self.key = key
+        self.cost = cost
+        self.access_date = access_date
+        self.parent = parent
+
+    def data(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def touch(self):
+        self.access_date = time.time()
+        try:
+            # The modification time doubles as the persistent access date
+            os.utime(self.path, (self.access_date, self.access_date))
+        except OSError:
+            pass
+
+    def remove_file_from_disk(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class FileCache(QObject):
+    """
+    Content addressed on-disk cache. Every item is stored in a file named after
+    its key; the items are kept in least-recently-used order and the oldest ones
+    are evicted once the total cost (in bytes) exceeds max_cost.
+    """
+
+    def __init__(self, max_cost, parent):
+        super().__init__(parent)
+        self._max_cost = max_cost
+        self._total_cost = 0
+        self._path = None
+        self._items = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self):
+        return self._path
+
+    def set_path(self, path, item_generator):
+        if path == self._path:
+            return True
+
+        self.clear_from_memory()
+        self._path = path
+
+        if not path:
+            return False
+
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError:
+            qDebug("cannot create cache directory {}".format(path))
+            self._path = None
+            return False
+
+        self.update_from_disk(item_generator)
+        return True
+
+    def max_cost(self):
+        return self._max_cost
 
+    def set_max_cost(self, max_cost):
+        self._max_cost = max_cost
+        self.evict()
 
-class FileCache:
-    def __init__(self, number, parent):
-        # TODO FileCache
-        pass
+    def total_cost(self):
+        return self._total_cost
+
+    def count(self):
+        return len(self._items)
+
+    def has_item(self, key):
+        return key in self._items
+
+    def item(self, key):
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._items.move_to_end(key)
+        item.touch()
+        return item
 
     def add_item(self, data, key, item_generator):
-        pass
\ No newline at end of file
+        if not self._path:
+            return False
+
+        cost = len(data)
+        if cost > self._max_cost:
+            return False
+
+        file_path = os.path.join(self._path, key)
+        tmp_path = file_path + TMP_SUFFIX
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+        except IOError:
+            qDebug("cannot write cache item {}".format(file_path))
+            return False
+
+        self.remove_item(key, False)
+        self._insert(item_generator(file_path, key, cost, time.time(), self))
+        self.evict()
+        return True
+
+    def remove_item(self, key, from_disk=True):
+        item = self._items.pop(key, None)
+        if item is None:
+            return
+
+        self._total_cost -= item.cost
+        if from_disk:
+            item.remove_file_from_disk()
+
+    def clear_from_disk(self):
+        for item in self._items.values():
+            item.remove_file_from_disk()
+        self.clear_from_memory()
+
+    def clear_from_memory(self):
+        self._items.clear()
+        self._total_cost = 0
+
+    def update_from_disk(self, item_generator):
+        self.clear_from_memory()
+        if not self._path:
+            return
+
+        # Only stat() the entries, the files themselves are read lazily. Files
+        # not named like a key were not written by the cache, they are never
+        # evicted nor cleared, the directory may be one the user already had
+        entries = []
+        now = time.time()
+        try:
+            with os.scandir(self._path) as it:
+                for entry in it:
+                    try:
+                        if not entry.is_file():
+                            continue
+                        if entry.name.endswith(TMP_SUFFIX) and is_cache_key(entry.name[:-len(TMP_SUFFIX)]):
+                            # Left over by a process which died before renaming it
+                            if now - entry.stat().st_mtime > STALE_TMP_AGE:
+                                os.remove(entry.path)
+                            continue
+                        if not is_cache_key(entry.name):
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        # Removed meanwhile
+                        continue
+                    entries.append((stat.st_mtime, entry.path, entry.name, stat.st_size))
+        except OSError:
+            qDebug("cannot read cache directory {}".format(self._path))
+            entries = []
+
+        entries.sort()
+        for access_date, path, key, cost in entries:
+            self._insert(item_generator(path, key, cost, access_date, self))
+
+        self.evict()
+
+    def evict(self):
+        while self._total_cost > self._max_cost and self._items:
+            key = next(iter(self._items))
+            qDebug("evicting {} from cache".format(key))
+            self.remove_item(key)
+            self.evictions += 1
+
+    # Private methods
+
+    def _insert(self, item):
+        self._items[item.key] = item
+        self._total_cost += item.cost
@@ -0,0 +1,192 @@
+import hashlib
+
+from PySide6.QtCore import QObject
+
+LINE_OTHER = ord(' ')
+LINE_START = ord('S')
+LINE_END = ord('E')
+LINE_INCLUDE = ord('I')
+
+INCLUDE_DIRECTIVES = ("!include", "!import")
+
+
+def line_kind(line):
+    stripped = line.lstrip()
+    if stripped.startswith("@start"):
+        return LINE_START
+    if stripped.startswith("@end"):
+        return LINE_END
+    if stripped.startswith(INCLUDE_DIRECTIVES):
+        return LINE_INCLUDE
+    return LINE_OTHER
+
+
+def line_digest(line):
+    return hashlib.md5(line.encode('utf-8')).digest()
+
+
+def combine_digests(digests):
+    return hashlib.md5(b"".join(digests)).hexdigest()
+
+
+def diagram_ranges(kinds):
+    """
+    (first, last) line numbers of the @start/@end blocks, kinds holds the
+    line_kind of every line. Unlike parse_diagrams, which rejects documents
+    PlantUML cannot answer through the pipe, the editor keeps every block:
+    an unterminated one runs to the end of the document and a @start inside
+    a block does not end it, the error is then reported for that diagram.
+    """
+    ranges = []
+    first = kinds.find(LINE_START)
+    while first >= 0:
+        last = kinds.find(LINE_END, first + 1)
+        if last < 0:
+            last = len(kinds) - 1
+        ranges.append((first, last))
+        first = kinds.find(LINE_START, last + 1)
+    return ranges
+
+
+def split_lines(text):
+    """The blocks of a plain text as lists of lines, found like DocumentFingerprint.diagrams does"""
+    lines = text.split("\n")
+    return [lines[first:last + 1] for first, last in diagram_ranges(bytes(line_kind(line) for line in lines))]
+
+
+def text_fingerprint(text):
+    """Fingerprint of a text, the same DocumentFingerprint computes for these lines"""
+    return combine_digests([line_digest(line) for line in text.splitlines()])
+
+
+class Diagram:
+    """A @start/@end block of a document, first and last are line numbers"""
+
+    def __init__(self, name, first, last, fingerprint):
+        self.name = name
+        self.first = first
+        self.last = last
+        self.fingerprint = fingerprint
+
+
+class DocumentFingerprint(QObject):
+    """
+    Fingerprints of the diagrams of a QTextDocument, kept up to date as it
+    is edited. Every line (QTextBlock) has its own digest, a diagram's
+    fingerprint is the digest of the digests of its lines. An edit only
+    hashes the lines it touched again, and only the diagrams overlapping
+    them get a new fingerprint. Finding the diagram boundaries is done on
+    bytes, without extracting or encoding the document text.
+
+    QTextDocument only emits contentsChange once it has a layout, which is
+    the case for the document of a text editor.
+    """
+
+    def __init__(self, document, parent=None):
+        super().__init__(parent)
+        self.document = document
+        self.texts = []
+        self.digests = []
+        self.kinds = bytearray()
+        self.diagrams_cache = None
+        # Fingerprints of the lines first..last, keyed by (first, last)
+        self.fingerprints = {}
+
+        self.document.contentsChange.connect(self.on_contents_change)
+        self.rebuild()
+
+    def rebuild(self):
+        self.texts = []
+        self.digests = []
+        self.kinds = bytearray()
+        block = self.document.firstBlock()
+        while block.isValid():
+            self.append_line(block.text())
+            block = block.next()
+        self.diagrams_cache = None
+        self.fingerprints = {}
+
+    def append_line(self, text):
+        self.texts.append(text)
+        self.digests.append(line_digest(text))
+        self.kinds.append(line_kind(text))
+
+    def on_contents_change(self, position, removed, added):
+        first = self.document.findBlock(position)
+        last = self.document.findBlock(position + added)
+        if not first.isValid():
+            first = self.document.firstBlock()
+        if not last.isValid():
+            last = self.document.lastBlock()
+
+        # Lines after the change only moved: the old lines first..old_last
+        # became first..last
+        first_number = first.blockNumber()
+        last_number = last.blockNumber()
+        old_last_number = last_number - (self.document.blockCount() - len(self.texts))
+        if old_last_number < first_number - 1 or old_last_number >= len(self.texts):
+            self.rebuild()
+            return
+
+        texts = []
+        block = first
+        while block.isValid() and block.blockNumber() <= last_number:
+            texts.append(block.text())
+            block = block.next()
+
+        self.texts[first_number:old_last_number + 1] = texts
+        self.digests[first_number:old_last_number + 1] = [line_digest(text) for text in texts]
+        self.kinds[first_number:old_last_number + 1] = bytes(line_kind(text) for text in texts)
+        self.diagrams_cache = None
+
+        # Fingerprints of the lines before the change are still valid, the ones after it moved
+        shift = last_number - old_last_number
+        fingerprints = {}
+        for (first_line, last_line), fingerprint in self.fingerprints.items():
+            if last_line < first_number:
+                fingerprints[(first_line, last_line)] = fingerprint
+            elif first_line > old_last_number:
+                fingerprints[(first_line + shift, last_line + shift)] = fingerprint
+        self.fingerprints = fingerprints
+
+    def diagrams(self):
+        """The Diagram of every @start/@end block, see diagram_ranges"""
+        if self.diagrams_cache is not None:
+            return self.diagrams_cache
+
+        diagrams = []
+        fingerprints = {}
+        for first, last in diagram_ranges(self.kinds):
+            fingerprint = self.fingerprints.get((first, last))
+            if fingerprint is None:
+                fingerprint = combine_digests(self.digests[first:last + 1])
+            fingerprints[(first, last)] = fingerprint
+
+            directive = self.texts[first].split(None, 1)
+            name = directive[1].strip() if len(directive) > 1 else ""
+            diagrams.append(Diagram(name, first, last, fingerprint))
+
+        self.fingerprints = fingerprints
+        self.diagrams_cache = diagrams
+        return diagrams
+
+    def text(self, first=0, last=None):
+        """Text of the lines first to last, with a trailing new line"""
+        if last is None:
+            last = len(self.texts) - 1
+        return "\n".join(self.texts[first:last + 1]) + "\n"
+
+    def include_lines(self, first=0, last=None):
+        """Include directives of the lines first to last, as text"""
+        if last is None:
+            last = len(self.texts) - 1
+
+        lines = []
+        index = self.kinds.find(LINE_INCLUDE, first, last + 1)
+        while index >= 0:
+            lines.append(self.texts[index])
+            index = self.kinds.find(LINE_INCLUDE, index + 1, last + 1)
+        return "\n".join(lines)
+
+    def is_empty(self):
+        return not any(text.strip() for text in self.texts)
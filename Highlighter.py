@@ -0,0 +1,108 @@
+import re
+
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QSyntaxHighlighter, QTextCharFormat, QFont, QColor
+
+from Linter import NOTE_START_PATTERN, NOTE_END_PATTERN
+
+STATE_NORMAL = 0
+STATE_COMMENT = 1  # inside /' ... '/
+STATE_NOTE = 2  # inside a multi-line note, up to "end note"
+
+KEYWORDS = [
+    "abstract", "activate", "actor", "agent", "alt", "as", "artifact", "autonumber", "boundary", "box", "break",
+    "card", "class", "cloud", "collections", "component", "control", "critical", "database", "deactivate",
+    "destroy", "detach", "else", "elseif", "end", "endif", "endwhile", "entity", "enum", "folder", "fork", "frame",
+    "group", "header", "footer", "hide", "if", "interface", "is", "kill", "left", "legend", "endlegend", "loop",
+    "namespace", "node", "note", "hnote", "rnote", "object", "of", "on", "opt", "over", "package", "par", "partition", "participant",
+    "queue", "rectangle", "ref", "repeat", "return", "right", "show", "skinparam", "stack", "start", "state",
+    "stop", "storage", "then", "title", "top", "bottom", "to", "usecase", "while", "direction",
+]
+
+# A single pattern per line: the first alternative matching at a position wins
+TOKEN_PATTERN = re.compile(
+    r"(?P<comment>^\s*'.*$)"
+    r"|(?P<directive>^\s*@(?:start|end)\w*)"
+    r"|(?P<preprocessor>^\s*!\w+)"
+    r'|(?P<string>"[^"]*")'
+    r"|(?P<color>#\w+)"
+    r"|(?P<arrow><?[-.=]+(?:\[[^\]]*\])?[-.=]*>+|<+[-.=]+)"
+    r"|(?P<keyword>\b(?:" + "|".join(KEYWORDS) + r")\b)"
+)
+COMMENT_START = "/'"
+COMMENT_END = "'/"
+
+
+def make_format(color, bold=False, italic=False):
+    text_format = QTextCharFormat()
+    text_format.setForeground(QColor(color))
+    if bold:
+        text_format.setFontWeight(QFont.Bold)
+    text_format.setFontItalic(italic)
+    return text_format
+
+
+class PlantUmlHighlighter(QSyntaxHighlighter):
+    """
+    Syntax highlighting of PlantUML documents. The state carried from a
+    line to the next one (block comments and multi-line notes) is stored
+    as the block state, so QSyntaxHighlighter only highlights the edited
+    lines again, and the following ones as long as their state changes.
+    """
+
+    def __init__(self, document):
+        super().__init__(document)
+        self.formats = {
+            "comment": make_format(Qt.darkGray, italic=True),
+            "directive": make_format(Qt.darkBlue, bold=True),
+            "preprocessor": make_format(Qt.darkMagenta),
+            "string": make_format(Qt.darkGreen),
+            "color": make_format(Qt.darkCyan),
+            "arrow": make_format(Qt.darkRed, bold=True),
+            "keyword": make_format(Qt.darkBlue, bold=True),
+            "note": make_format(QColor(128, 96, 0)),
+        }
+
+    def highlightBlock(self, text):
+        state = self.previousBlockState()
+
+        if state == STATE_NOTE:
+            if NOTE_END_PATTERN.match(text):
+                self.setFormat(0, len(text), self.formats["keyword"])
+                self.setCurrentBlockState(STATE_NORMAL)
+            else:
+                self.setFormat(0, len(text), self.formats["note"])
+                self.setCurrentBlockState(STATE_NOTE)
+            return
+
+        start = 0
+        if state == STATE_COMMENT:
+            end = text.find(COMMENT_END)
+            if end < 0:
+                self.setFormat(0, len(text), self.formats["comment"])
+                self.setCurrentBlockState(STATE_COMMENT)
+                return
+            start = end + len(COMMENT_END)
+            self.setFormat(0, start, self.formats["comment"])
+
+        self.setCurrentBlockState(STATE_NORMAL)
+        while start < len(text):
+            comment = text.find(COMMENT_START, start)
+            self.highlight_tokens(text, start, comment if comment >= 0 else len(text))
+            if comment < 0:
+                break
+
+            end = text.find(COMMENT_END, comment + len(COMMENT_START))
+            if end < 0:
+                self.setFormat(comment, len(text) - comment, self.formats["comment"])
+                self.setCurrentBlockState(STATE_COMMENT)
+                return
+            start = end + len(COMMENT_END)
+            self.setFormat(comment, start - comment, self.formats["comment"])
+
+        if NOTE_START_PATTERN.match(text):
+            self.setCurrentBlockState(STATE_NOTE)
+
+    def highlight_tokens(self, text, start, end):
+        for match in TOKEN_PATTERN.finditer(text, start, end):
+            self.setFormat(match.start(), match.end() - match.start(), self.formats[match.lastgroup])
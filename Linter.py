@@ -0,0 +1,152 @@
+import re
+
+from PySide6.QtCore import QCoreApplication, QT_TRANSLATE_NOOP
+
+# Only these diagram kinds share the syntax checked below, the others
+# (@startditaa, @startjson, ...) are only checked for their @start/@end
+CHECKED_DIAGRAM_KINDS = ("uml",)
+
+DIRECTIVE_PATTERN = re.compile(r"^@(start|end)(\w*)")
+STRING_PATTERN = re.compile(r'"[^"]*"')
+ARROW_PATTERN = re.compile(r"[-.=]+>|<[-.=]+")
+# "note left: text" and the floating 'note "text" as N1' are single line notes,
+# "note left", 'note right of "A"' or "floating note left" start a multi-line
+# one. Shared with the highlighter.
+NOTE_START_PATTERN = re.compile(r'^\s*(?:floating\s+)?[hr]?note\b(?!\s*")[^:]*$')
+NOTE_END_PATTERN = re.compile(r"^\s*end\s*[hr]?note\b")
+LEGEND_START_PATTERN = re.compile(r"^legend\b")
+LEGEND_END_PATTERN = re.compile(r"^end\s*legend\b")
+
+# (opening pattern, closing pattern, name, closing needs an opening) of the blocks which must be closed.
+# A lone "end" is valid in activity diagrams, where it ends the flow.
+BLOCKS = [
+    (re.compile(r"^(?:alt|opt|loop|par|break|critical|group)(?:\s|$)"), re.compile(r"^end$"),
+     "alt/opt/loop/group", False),
+    (re.compile(r"^box(?:\s|$)"), re.compile(r"^end\s*box\b"), "box", True),
+    (re.compile(r"^if\s*[(\"]"), re.compile(r"^end\s*if\b"), "if", True),
+    (re.compile(r"^while\s*\("), re.compile(r"^end\s*while\b"), "while", True),
+    (re.compile(r"^repeat\s*(?::.*)?$"), re.compile(r"^repeat\s*while\b"), "repeat", True),
+    (re.compile(r"^fork$"), re.compile(r"^end\s*(?:fork|merge)\b"), "fork", True),
+]
+
+MISSING_END = QT_TRANSLATE_NOOP("Linter", "Missing @end{0}")
+MISMATCHED_END = QT_TRANSLATE_NOOP("Linter", "@end{0} does not match @start{1}")
+NESTED_START = QT_TRANSLATE_NOOP("Linter", "@start inside a diagram which is not closed")
+UNCLOSED_COMMENT = QT_TRANSLATE_NOOP("Linter", "Block comment is never closed")
+UNCLOSED_NOTE = QT_TRANSLATE_NOOP("Linter", "Note is never closed by \"end note\"")
+UNCLOSED_LEGEND = QT_TRANSLATE_NOOP("Linter", "Legend is never closed by \"endlegend\"")
+UNCLOSED_BLOCK = QT_TRANSLATE_NOOP("Linter", "\"{0}\" is never closed")
+UNOPENED_BLOCK = QT_TRANSLATE_NOOP("Linter", "\"{0}\" without matching opening")
+UNCLOSED_BRACE = QT_TRANSLATE_NOOP("Linter", "\"{\" is never closed")
+UNOPENED_BRACE = QT_TRANSLATE_NOOP("Linter", "\"}\" without matching \"{\"")
+
+
+def message(text, *arguments):
+    text = QCoreApplication.translate("Linter", text)
+    return text.format(*arguments) if arguments else text
+
+
+def lint_diagram(lines):
+    """
+    Obvious structural errors of a @start/@end block, found without running
+    PlantUML. Returns a sorted list of (line index, message).
+    """
+    start = DIRECTIVE_PATTERN.match(lines[0].strip()) if lines else None
+    if start is None:
+        return []
+    kind = start.group(2)
+
+    errors = []
+    last = lines[-1].strip()
+    end = DIRECTIVE_PATTERN.match(last)
+    if end is None or end.group(1) != "end":
+        errors.append((len(lines) - 1, message(MISSING_END, kind)))
+    elif end.group(2) != kind:
+        errors.append((len(lines) - 1, message(MISMATCHED_END, end.group(2), kind)))
+    body = lines[1:-1] if end is not None else lines[1:]
+
+    # PlantUML never answers for a diagram with a nested @start
+    errors.extend((index + 1, message(NESTED_START)) for index, line in enumerate(body)
+                  if line.lstrip().startswith("@start"))
+
+    if kind in CHECKED_DIAGRAM_KINDS:
+        errors.extend((index + 1, text) for index, text in lint_body(body))
+    return sorted(errors)
+
+
+def lint_body(lines):
+    errors = []
+    blocks = []  # (block index in BLOCKS, line index)
+    braces = []  # line indexes
+    comment = None
+    multi_line = None  # (closing pattern, message, line index) of a note or legend
+
+    for index, line in enumerate(lines):
+        text = line.strip()
+        if comment is not None:
+            if "'/" not in text:
+                continue
+            comment = None
+            text = text[text.index("'/") + 2:].strip()
+
+        if multi_line is not None:
+            if multi_line[0].match(text):
+                multi_line = None
+            continue
+
+        if not text or text.startswith("'"):
+            continue
+
+        # Only what is outside of the block comments is checked
+        position = text.find("/'")
+        while position >= 0:
+            end = text.find("'/", position + 2)
+            if end < 0:
+                comment = index
+                text = text[:position]
+                break
+            text = text[:position] + " " + text[end + 2:]
+            position = text.find("/'")
+        text = text.strip()
+        if not text:
+            continue
+
+        if NOTE_START_PATTERN.match(text):
+            multi_line = (NOTE_END_PATTERN, UNCLOSED_NOTE, index)
+            continue
+        if LEGEND_START_PATTERN.match(text):
+            multi_line = (LEGEND_END_PATTERN, UNCLOSED_LEGEND, index)
+            continue
+
+        if not ARROW_PATTERN.search(text):
+            for block, (opening, closing, name, needs_opening) in enumerate(BLOCKS):
+                if opening.match(text):
+                    blocks.append((block, index))
+                    break
+                if closing.match(text):
+                    if blocks and blocks[-1][0] == block:
+                        blocks.pop()
+                    elif needs_opening:
+                        errors.append((index, message(UNOPENED_BLOCK, text)))
+                    break
+
+        if "{" not in text and "}" not in text:
+            continue
+        # Braces in strings and message texts ("A -> B : returns {") are not blocks
+        text = STRING_PATTERN.sub("", text).split(":", 1)[0]
+        for character in text:
+            if character == "{":
+                braces.append(index)
+            elif character == "}":
+                if braces:
+                    braces.pop()
+                else:
+                    errors.append((index, message(UNOPENED_BRACE)))
+
+    if comment is not None:
+        errors.append((comment, message(UNCLOSED_COMMENT)))
+    if multi_line is not None:
+        errors.append((multi_line[2], message(multi_line[1])))
+    errors.extend((index, message(UNCLOSED_BLOCK, BLOCKS[block][2])) for block, index in blocks)
+    errors.extend((index, message(UNCLOSED_BRACE)) for index in braces)
+    return sorted(errors)
@@ -1,19 +1,25 @@
 import os
 import sys
-import hashlib
 
-from PySide6.QtCore import QT_TRANSLATE_NOOP, qDebug, QTimer, QSettings, QProcess
-from PySide6.QtCore import QFileInfo, Qt
+from PySide6.QtCore import QT_TRANSLATE_NOOP, qDebug, QTimer, QSettings
+from PySide6.QtCore import QEvent, QFileSystemWatcher, Qt
 from PySide6.QtGui import QIcon, QKeySequence, QFontMetrics, QPixmap, QClipboard, QAction
 from PySide6.QtWidgets import QMainWindow, QScrollArea, QDockWidget, QApplication
 from PySide6.QtWidgets import QLabel, QMessageBox, QFileDialog, QDialog
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QComboBox, QTabWidget
 
+from Dependencies import DependencyGraph
+from DocumentTab import DocumentTab
 from ImageFormat import ImageFormat
-from PreferencesDialog import PreferencesDialog
+from Linter import lint_diagram
 from PreviewWindow import PreviewWindow, Mode
 from RecentDocuments import RecentDocuments
-from TextEdit import TextEdit
+from RenderServer import RenderServer
 from FileCache import FileCache, FileCacheItem
+from MemoryCache import MemoryCache
+from RenderTiming import RenderTimingLog, RefreshTiming, STAGE_HASH, STAGE_CACHE_LOOKUP
+from RenderTiming import STAGE_DECODE, STAGE_PAINT, SOURCE_MEMORY_CACHE, SOURCE_DISK_CACHE
+from Utils import cache_size_to_string, make_fingerprint_key, default_cache_path
 from SettingsConstants import *
 
 ASSISTANT_ITEM_DATA_ROLE = Qt.UserRole
@@ -21,18 +27,18 @@ ASSISTANT_ITEM_NOTES_ROLE = Qt.UserRole + 1
 
 MAX_RECENT_DOCUMENT_SIZE = 10
 STATUS_BAR_TIMEOUT = 3000  # in miliseconds
+FILE_CHANGE_COALESCE_DELAY = 250  # in miliseconds, bursts of file changes are handled at once
 TITLE_FORMAT_STRING = "{0}[*] - {1}"
 EXPORT_TO_MENU_FORMAT_STRING = QT_TRANSLATE_NOOP("MainWindow", "Export to {0}")
 EXPORT_TO_LABEL_FORMAT_STRING = QT_TRANSLATE_NOOP("MainWindow", "Export to: {0}")
 AUTO_REFRESH_STATUS_LABEL = QT_TRANSLATE_NOOP("MainWindow", "Auto-refresh")
+DIAGRAM_FORMAT_STRING = QT_TRANSLATE_NOOP("MainWindow", "Diagram {0}")
+SYNTAX_ERROR_FORMAT_STRING = QT_TRANSLATE_NOOP("MainWindow", "Syntax error on line {0}: {1}")
 CACHE_SIZE_FORMAT_STRING = QT_TRANSLATE_NOOP("MainWindow", "Cache: {0}")
+CACHE_STATISTICS_FORMAT_STRING = QT_TRANSLATE_NOOP("MainWindow",
+                                                   "{0}: {1} in {2} items, {3} hits, {4} misses, {5} evictions")
 ASSISTANT_ICON_SIZE = (128, 128)
-
-
-def compute_md5_hash(my_string):
-    m = hashlib.md5()
-    m.update(my_string.encode('utf-8'))
-    return m.hexdigest()
+RENDER_TIME_SMOOTHING = 0.3  # weight of the last render in the render time estimate
 
 
 def resource_path(path):
@@ -52,9 +58,10 @@ class MainWindow(QMainWindow):
         self.setWindowIcon(QIcon(resource_path('icons/plantuml.png')))
 
         self.has_valid_paths = False
-        self.process = None
+        self.render_server = RenderServer(self)
+        self.render_server.finished.connect(self.refresh_finished)
+        self.render_server.failed.connect(self.refresh_failed)
         self.current_image_format = ImageFormat.PngFormat
-        self.needs_refresh = False
         self.refresh_on_save = False
 
         self.image_format_names = {
@@ -62,26 +69,48 @@ class MainWindow(QMainWindow):
             ImageFormat.PngFormat: "png",
         }
 
+        # Single shot debounce timer, restarted on every edit
         self.auto_refresh_timer = QTimer(self)
+        self.auto_refresh_timer.setSingleShot(True)
         self.auto_refresh_timer.timeout.connect(self.refresh)
+        self.autorefresh_enabled = False
+        self.auto_refresh_min_delay = SETTINGS_AUTOREFRESH_MIN_DELAY_DEFAULT
+        self.auto_refresh_max_delay = SETTINGS_AUTOREFRESH_TIMEOUT_DEFAULT
 
         self.use_cache = False
         self.cache = FileCache(0, self)
-        self.cached_image = None
-
-        self.document_path = None
-        self.export_path = None
+        self.memory_cache = MemoryCache(SETTINGS_MEMORY_CACHE_MAX_SIZE_DEFAULT)
+        self.dependency_graph = DependencyGraph()
+
+        # The documents and their dependencies, edited by other applications
+        self.file_watcher = QFileSystemWatcher(self)
+        self.file_watcher.fileChanged.connect(self.on_watched_file_changed)
+        self.changed_files = set()
+        self.file_change_timer = QTimer(self)
+        self.file_change_timer.setSingleShot(True)
+        self.file_change_timer.setInterval(FILE_CHANGE_COALESCE_DELAY)
+        self.file_change_timer.timeout.connect(self.on_watched_files_changed)
+
+        self.timing_log = RenderTimingLog(self)
+        self.render_timing = None
+        self.paint_timing = None
 
         # TODO: Connect signal to recent_documents
         self.recent_documents = RecentDocuments(MAX_RECENT_DOCUMENT_SIZE, self)
 
-        self.last_key = None
         self.last_dir = os.path.dirname(os.path.realpath(__file__))
 
-        self.editor = TextEdit(self)
-        self.editor.document().contentsChanged.connect(self.on_editor_changed)
+        # One DocumentTab per document, self.tab is the one shown
+        self.tabs = []
+        self.tab = None
+        self.tab_widget = QTabWidget(self)
+        self.tab_widget.setDocumentMode(True)
+        self.tab_widget.setTabsClosable(True)
+        self.tab_widget.setMovable(True)
+        self.tab_widget.currentChanged.connect(self.on_current_tab_changed)
+        self.tab_widget.tabCloseRequested.connect(self.on_tab_close_requested)
 
-        self.setCentralWidget(self.editor)
+        self.setCentralWidget(self.tab_widget)
 
         self.create_dock_windows()
         self.create_actions()
@@ -95,11 +124,19 @@ class MainWindow(QMainWindow):
 
         self.read_settings()
 
-        # TODO: Single application?
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.ActivationChange and self.isActiveWindow():
+            # Included files may have been edited in another application. The
+            # other tabs are checked when shown, or by the file watcher
+            self.on_dependencies_changed()
 
     def closeEvent(self, event):
-        if self.maybe_save():
+        if all(self.maybe_save(tab) for tab in list(self.tabs)):
             self.write_settings()
+            self.render_server.stop()
+            # Queued rasterizations would keep the process alive after the window closes
+            self.image_widget.background_tasks.shutdown()
             event.accept()
         else:
             event.ignore()
@@ -109,18 +146,49 @@ class MainWindow(QMainWindow):
         dock.setMinimumWidth(300)
 
         self.image_widget = PreviewWindow(dock)
+        self.image_widget.painted.connect(self.on_preview_painted)
 
         self.image_widget_scrollarea = QScrollArea()
         self.image_widget_scrollarea.setWidget(self.image_widget)
         self.image_widget_scrollarea.setAlignment(Qt.AlignCenter)
         self.image_widget_scrollarea.setWidgetResizable(True)
 
-        dock.setWidget(self.image_widget_scrollarea)
+        # Documents with several diagrams show one of them at a time
+        self.diagram_selector = QComboBox()
+        self.diagram_selector.setVisible(False)
+        self.diagram_selector.currentIndexChanged.connect(self.on_diagram_selected)
+
+        widget = QWidget(dock)
+        layout = QVBoxLayout(widget)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.diagram_selector)
+        layout.addWidget(self.image_widget_scrollarea)
+
+        dock.setWidget(widget)
         dock.setObjectName("diagram")
         return dock
 
+    def create_dock_timing(self):
+        dock = QDockWidget(self.tr("Render timing"), self)
+        dock.setObjectName("render_timing")
+        # Its content is only built once the dock is shown
+        dock.visibilityChanged.connect(self.on_timing_dock_visibility_changed)
+        return dock
+
+    def on_timing_dock_visibility_changed(self, visible):
+        if visible and self.timing_dock.widget() is None:
+            from TimingWindow import TimingWindow
+
+            self.timing_dock.setWidget(TimingWindow(self.timing_log, self.timing_dock))
+
     def create_dock_windows(self):
-        self.addDockWidget(Qt.RightDockWidgetArea, self.create_dock_diagram())
+        self.diagram_dock = self.create_dock_diagram()
+        self.addDockWidget(Qt.RightDockWidgetArea, self.diagram_dock)
+
+        self.timing_dock = self.create_dock_timing()
+        self.addDockWidget(Qt.RightDockWidgetArea, self.timing_dock)
+        self.tabifyDockWidget(self.diagram_dock, self.timing_dock)
+        self.diagram_dock.raise_()
 
     def create_actions(self):
         # File menu actions
@@ -144,6 +212,12 @@ class MainWindow(QMainWindow):
         self.save_as_document_action.setShortcut(QKeySequence.SaveAs)
         self.save_as_document_action.triggered.connect(self.on_save_as_document_triggered)
 
+        self.close_document_action = QAction(QIcon.fromTheme("document-close"),
+                                             self.tr("&Close document"), self)
+        self.close_document_action.setShortcut(QKeySequence.Close)
+        self.close_document_action.triggered.connect(
+            lambda: self.on_tab_close_requested(self.tab_widget.currentIndex()))
+
         self.export_image_action = QAction(self.tr(EXPORT_TO_MENU_FORMAT_STRING.format("")), self)
         self.export_image_action.setShortcut(Qt.CTRL + Qt.Key_E)
         self.export_image_action.triggered.connect(self.on_export_image_action_triggered)
@@ -225,6 +299,7 @@ class MainWindow(QMainWindow):
         self.file_menu.addAction(self.open_document_action)
         self.file_menu.addAction(self.save_document_action)
         self.file_menu.addAction(self.save_as_document_action)
+        self.file_menu.addAction(self.close_document_action)
 
         # self.file_menu.addSeparator();
         # QMenu * recent_documents_submenu = m_fileMenu->addMenu(tr("Recent Documents"));
@@ -255,6 +330,7 @@ class MainWindow(QMainWindow):
         # self.settings_menu.addSeparator()
         # self.settings_menu.addAction(m_pngPreviewAction)
         # self.settings_menu.addAction(m_svgPreviewAction)
+        self.settings_menu.addAction(self.timing_dock.toggleViewAction())
         self.settings_menu.addSeparator()
         self.settings_menu.addAction(self.auto_refresh_action)
         self.settings_menu.addAction(self.auto_save_image_action)
@@ -361,18 +437,38 @@ class MainWindow(QMainWindow):
 
             # m_currentImageFormatLabel->setText(m_imageFormatNames[m_currentImageFormat].toUpper());
 
+        self.render_server.configure(self.java_path, self.plantuml_path,
+                                     self.image_format_names[self.current_image_format])
+        self.render_server.set_timeouts(
+            int(settings.value(SETTINGS_PROCESS_START_TIMEOUT, SETTINGS_PROCESS_START_TIMEOUT_DEFAULT)) * TIMEOUT_SCALE,
+            int(settings.value(SETTINGS_RENDER_TIMEOUT, SETTINGS_RENDER_TIMEOUT_DEFAULT)) * TIMEOUT_SCALE)
+
         self.autorefresh_enabled = settings.value(SETTINGS_AUTOREFRESH_ENABLED, 'true') == 'true'
         self.auto_refresh_action.setChecked(self.autorefresh_enabled)
-        self.auto_refresh_timer.setInterval(
-            settings.value(SETTINGS_AUTOREFRESH_TIMEOUT,
-                           int(SETTINGS_AUTOREFRESH_TIMEOUT_DEFAULT)))
-
-        if self.autorefresh_enabled:
-            qDebug("starting auto refresh timer")
-            self.auto_refresh_timer.start()
+        self.auto_refresh_max_delay = int(settings.value(SETTINGS_AUTOREFRESH_TIMEOUT,
+                                                         SETTINGS_AUTOREFRESH_TIMEOUT_DEFAULT))
+        self.auto_refresh_min_delay = int(settings.value(SETTINGS_AUTOREFRESH_MIN_DELAY,
+                                                         SETTINGS_AUTOREFRESH_MIN_DELAY_DEFAULT))
 
         self.auto_refresh_label.setEnabled(self.autorefresh_enabled)
 
+        self.use_cache = settings.value(SETTINGS_USE_CACHE, SETTINGS_USE_CACHE_DEFAULT, bool)
+        use_custom_cache = settings.value(SETTINGS_USE_CUSTOM_CACHE, SETTINGS_USE_CUSTOM_CACHE_DEFAULT, bool)
+        if use_custom_cache:
+            cache_path = settings.value(SETTINGS_CUSTOM_CACHE_PATH, default_cache_path())
+        else:
+            cache_path = default_cache_path()
+        self.cache.set_max_cost(int(settings.value(SETTINGS_CACHE_MAX_SIZE, SETTINGS_CACHE_MAX_SIZE_DEFAULT)))
+        if self.use_cache:
+            self.cache.set_path(cache_path, FileCacheItem)
+        self.memory_cache.set_max_cost(int(settings.value(SETTINGS_MEMORY_CACHE_MAX_SIZE,
+                                                          SETTINGS_MEMORY_CACHE_MAX_SIZE_DEFAULT)))
+        self.image_widget.set_zoom_cache_cost(int(settings.value(SETTINGS_ZOOM_CACHE_MAX_SIZE,
+                                                                 SETTINGS_ZOOM_CACHE_MAX_SIZE_DEFAULT)))
+        self.update_cache_size_info()
+
+        settings.endGroup()
+
     def write_settings(self):
         qDebug("Settings")
         settings = QSettings()
@@ -383,144 +479,403 @@ class MainWindow(QMainWindow):
         settings.endGroup()
         # settings.sync()
 
-    def maybe_save(self):
-        if self.editor.document().isModified():
-
+    def maybe_save(self, tab=None):
+        tab = tab or self.tab
+        if tab.is_modified():
+            # Shows which document is meant
+            self.tab_widget.setCurrentWidget(tab.editor)
             ret = QMessageBox.warning(self, qApp.applicationName(),
                                       self.tr('The document has been modified.\n'
                                               'Do you want to save your changes?'),
                                       buttons=QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel)
             if ret == QMessageBox.Save:
-                return self.save_document(self.document_path)
+                return self.save_document(tab.document_path)
             elif ret == QMessageBox.Cancel:
                 return False
 
         return True
 
-    def make_key_for_document(self, current_document):
-        key = "%s.%s" % (compute_md5_hash(current_document),
-                         self.image_format_names[self.current_image_format])
+    def make_key_for_diagram(self, tab, diagram):
+        # Edits of included files change the key of the diagrams including them
+        dependencies = self.dependency_graph.fingerprint(tab.fingerprint.include_lines(diagram.first, diagram.last),
+                                                         tab.working_directory())
+        return make_fingerprint_key(diagram.fingerprint, self.image_format_names[self.current_image_format],
+                                    dependencies)
+
+    def update_image_widget_mode(self):
+        if self.current_image_format == ImageFormat.SvgFormat:
+            self.image_widget.set_mode(Mode.SvgMode)
+        elif self.current_image_format == ImageFormat.PngFormat:
+            self.image_widget.set_mode(Mode.PngMode)
+
+    def update_diagrams(self, tab=None):
+        """Splits the document in diagrams, each one rendered and cached on its own"""
+        tab = tab or self.tab
+        tab.diagrams = [(diagram.name, self.make_key_for_diagram(tab, diagram), diagram)
+                        for diagram in tab.fingerprint.diagrams()]
+        tab.current_diagram = max(0, min(tab.current_diagram, len(tab.diagrams) - 1))
+        if tab is self.tab:
+            self.update_diagram_selector()
+
+    def update_diagram_selector(self):
+        names = [name or self.tr(DIAGRAM_FORMAT_STRING).format(index + 1)
+                 for index, (name, _, _) in enumerate(self.tab.diagrams)]
+        if names != [self.diagram_selector.itemText(i) for i in range(self.diagram_selector.count())]:
+            self.diagram_selector.blockSignals(True)
+            self.diagram_selector.clear()
+            self.diagram_selector.addItems(names)
+            self.diagram_selector.blockSignals(False)
+        if self.diagram_selector.currentIndex() != self.tab.current_diagram:
+            self.diagram_selector.blockSignals(True)
+            self.diagram_selector.setCurrentIndex(self.tab.current_diagram)
+            self.diagram_selector.blockSignals(False)
+        self.diagram_selector.setVisible(len(self.tab.diagrams) > 1)
+
+    def current_diagram_key(self):
+        return self.tab.current_diagram_key()
+
+    def missing_diagrams(self, tab=None):
+        """(key, Diagram) of the diagrams which are neither cached nor being rendered"""
+        tab = tab or self.tab
+        missing = {}
+        for _, key, diagram in tab.diagrams:
+            if self.memory_cache.has_item(key) or (self.use_cache and self.cache and self.cache.has_item(key)):
+                continue
+            if self.render_server.is_rendering(key) or key in missing:
+                continue
+            missing[key] = diagram
+        return list(missing.items())
+
+    def lint_diagrams(self, tab, diagrams):
+        """
+        Checks diagrams, a list of (key, Diagram), for obvious syntax errors
+        and highlights them in the editor. Returns the problems as a list of
+        (line number, message).
+        """
+        problems = []
+        for _, diagram in diagrams:
+            errors = lint_diagram(tab.fingerprint.texts[diagram.first:diagram.last + 1])
+            problems.extend((diagram.first + index, message) for index, message in errors)
+        tab.editor.set_problems(problems)
+        return problems
+
+    def refresh_from_cache(self, timing=None):
+        if timing is None:
+            timing = RefreshTiming()
+
+        self.update_diagrams()
+        timing.end_stage(STAGE_HASH)
+        return self.show_cached_diagrams(timing)
+
+    def show_cached_diagrams(self, timing):
+        """
+        Shows the current diagram if it is cached. Returns True when no
+        diagram of the document needs to be rendered.
+        """
+        if not self.tab.diagrams:
+            return False
+
+        key = self.current_diagram_key()
+        timing.key = key
+        if key != self.tab.last_key or self.tab.cached_image is None:
+            # Otherwise it is already shown
+            self.show_cached_diagram(key, timing)
+
+        if self.missing_diagrams():
+            self.update_cache_size_info()
+            return False
 
-        return key
+        self.tab.editor.set_problems([])
+        self.tab.needs_refresh = False
+        self.render_server.cancel_pending(self.tab)
+        return True
 
-    def refresh_from_cache(self):
-        # TODO: Refresh from cache
-        return False
+    def show_cached_diagram(self, key, timing):
+        memory_item = self.memory_cache.item(key)
+        if memory_item is not None:
+            timing.end_stage(STAGE_CACHE_LOOKUP)
+            timing.source = SOURCE_MEMORY_CACHE
+            qDebug("memory cache hit: %s" % key)
+            self.show_preview(key, memory_item.data, memory_item.preview, timing)
+            self.statusBar().showMessage(self.tr("Refreshed from cache"), STATUS_BAR_TIMEOUT)
+            return True
+
+        if not self.use_cache or not self.cache:
+            return False
+
+        item = self.cache.item(key)
+        if item is None:
+            timing.end_stage(STAGE_CACHE_LOOKUP)
+            return False
+
+        data = item.data()
+        timing.end_stage(STAGE_CACHE_LOOKUP)
+        if not data:
+            self.cache.remove_item(key)
+            return False
+
+        qDebug("cache hit: %s" % key)
+        timing.source = SOURCE_DISK_CACHE
+        self.show_preview(key, data, None, timing)
+        self.statusBar().showMessage(self.tr("Refreshed from cache"), STATUS_BAR_TIMEOUT)
+        return True
 
-    def refresh(self, forced=False):
+    def refresh(self, forced=False, tab=None):
+        """
+        Renders the diagrams of tab, the current one by default. Nothing is
+        shown for a tab in the background, its images are only cached.
+        """
         qDebug("Refreshing")
-        if self.process:
-            qDebug("still processing previous refresh. skipping...")
+        tab = tab or self.tab
+        if tab is None or (not tab.needs_refresh and not forced):
+            return
+
+        foreground = tab is self.tab
+        timing = RefreshTiming()
+        if tab.fingerprint.is_empty():
+            qDebug("empty document. skipping...")
             return
 
-        if not self.needs_refresh and not forced:
+        self.update_diagrams(tab)
+        timing.end_stage(STAGE_HASH)
+        if not tab.diagrams:
+            qDebug("no diagram in the document. skipping...")
+            if foreground:
+                self.statusBar().showMessage(self.tr("No diagram found in the document"), STATUS_BAR_TIMEOUT)
             return
 
+        if not forced and foreground and self.show_cached_diagrams(timing):
+            return
+
+        if forced:
+            diagrams = {}
+            for _, key, diagram in tab.diagrams:
+                diagrams[key] = diagram
+            diagrams = list(diagrams.items())
+        else:
+            # Only the diagrams whose text changed, the others come from the caches
+            diagrams = self.missing_diagrams(tab)
+
+        # Broken diagrams would only give PlantUML's error image back, they are
+        # not rendered until fixed, unless the refresh is forced
+        problems = self.lint_diagrams(tab, diagrams)
+        if problems and not forced:
+            problem_lines = set(line for line, _ in problems)
+            diagrams = [(key, diagram) for key, diagram in diagrams
+                        if not any(diagram.first <= line <= diagram.last for line in problem_lines)]
+            line, message = problems[0]
+            if foreground:
+                self.statusBar().showMessage(self.tr(SYNTAX_ERROR_FORMAT_STRING).format(line + 1, message))
+            if not diagrams:
+                tab.needs_refresh = False
+                return
+
         if not self.has_valid_paths:
             qDebug("Please configure paths for Java and PlantUML. Aborting...")
             self.statusBar().showMessage(
                 self.tr("Java and/or PlantUML not found. Please set them correctly in the \"Preferences\" dialog!"))
             return
 
-        if not forced and self.refresh_from_cache():
-            qDebug("HUH ")
+        tab.needs_refresh = False
+        documents = [(key, tab.fingerprint.text(diagram.first, diagram.last)) for key, diagram in diagrams]
+        if not documents:
             return
 
-        current_document = self.editor.toPlainText()
-        if not current_document.strip():
-            qDebug("empty document. skipping...")
+        if foreground:
+            self.update_image_widget_mode()
+            if not problems:
+                self.statusBar().showMessage(self.tr("Refreshing..."))
+
+            keys = [key for key, _ in documents]
+            timing.key = self.current_diagram_key() if self.current_diagram_key() in keys else keys[0]
+            self.render_timing = timing
+        qDebug("rendering {} of {} diagrams".format(len(documents), len(tab.diagrams)))
+
+        # Every tab has its own pending render, the current one goes first
+        self.render_server.schedule_many(documents, tab.working_directory(), tab)
+        self.update_watched_files()
+
+    def show_preview(self, key, data, preview=None, timing=None):
+        self.update_image_widget_mode()
+        if preview is None:
+            if timing is not None:
+                timing.begin_stage()
+            preview, cost = self.image_widget.decode(data)
+            if timing is not None:
+                timing.end_stage(STAGE_DECODE)
+            self.memory_cache.add_item(key, data, preview, cost + len(data))
+
+        self.tab.last_key = key
+        self.tab.cached_image = data
+        # The timing is completed once the preview has been painted
+        self.paint_timing = timing
+        self.image_widget.set_preview(preview, key, data)
+        self.update_cache_size_info()
+
+    def on_preview_painted(self, duration):
+        if self.paint_timing is None:
             return
 
-        self.needs_refresh = False
-
-        if self.current_image_format == ImageFormat.SvgFormat:
-            self.image_widget.set_mode(Mode.SvgMode)
-        elif self.current_image_format == ImageFormat.PngFormat:
-            self.image_widget.set_mode(Mode.PngMode)
+        self.paint_timing.set_stage(STAGE_PAINT, duration)
+        self.paint_timing.finish()
+        self.timing_log.add(self.paint_timing)
+        self.paint_timing = None
+
+    def refresh_finished(self, key, images):
+        timing = None
+        if self.render_timing is not None and self.render_timing.key == key:
+            timing = self.render_timing
+            self.render_timing = None
+            for stage, duration in self.render_server.last_timings.items():
+                if duration is not None:
+                    timing.set_stage(stage, duration)
+
+        data = images[0]
+        if self.tab is not None and key == self.current_diagram_key():
+            self.show_preview(key, data, None, timing)
+        elif any(tab.has_diagram(key) for tab in self.tabs):
+            # Decoded once it gets selected
+            self.memory_cache.add_item(key, data, None, len(data))
+        else:
+            # Outdated result: only store it in the file cache, never show it
+            qDebug("discarding outdated render {}".format(key))
 
-        key = self.make_key_for_document(current_document)
+        if self.use_cache and self.cache:
+            self.cache.add_item(data, key,
+                                lambda path, key, cost, date_date, parent: FileCacheItem(path, key, cost, date_date,
+                                                                                         parent))
 
-        self.statusBar().showMessage(self.tr("Refreshing..."))
+            self.update_cache_size_info()
 
-        arguments = ['-jar', self.plantuml_path, '-t%s' % self.image_format_names[self.current_image_format]]
+        if self.tab is not None and key == self.current_diagram_key():
+            self.statusBar().showMessage(self.tr("Refreshed"), STATUS_BAR_TIMEOUT)
 
-        # if self.use_custom_graphiz:
-        #     arguments.extend(["-graphvizdot", self.graphviz_path])
-        arguments.extend(["-charset", "UTF-8", "-pipe"])
+        for tab in self.tabs:
+            if tab.has_diagram(key):
+                tab.render_time_estimate += RENDER_TIME_SMOOTHING * \
+                    (self.render_server.last_render_time - tab.render_time_estimate)
 
-        self.last_key = key
-        qDebug("md5: %s" % key)
+    def auto_refresh_delay(self):
+        # Slow diagrams wait longer so fewer renders get superseded while typing
+        return int(min(self.auto_refresh_max_delay,
+                       max(self.auto_refresh_min_delay, self.tab.render_time_estimate)))
 
-        self.process = QProcess(self)
+    def schedule_auto_refresh(self):
+        if self.autorefresh_enabled and self.tab is not None and self.tab.needs_refresh:
+            self.auto_refresh_timer.start(self.auto_refresh_delay())
 
-        fi = QFileInfo(self.document_path)
-        self.process.setWorkingDirectory(fi.absolutePath())
+    def refresh_failed(self, key, message):
+        qDebug("refresh failed: {}".format(message))
+        self.statusBar().showMessage(self.tr("Refresh failed: {}").format(message), STATUS_BAR_TIMEOUT)
 
-        self.process.start(self.java_path, arguments)
-        if not self.process.waitForStarted():
-            qDebug("refresh subprocess failed to start")
-            return
+    def update_cache_size_info(self):
+        self.cache_size_label.setText(self.tr(CACHE_SIZE_FORMAT_STRING).format(
+            cache_size_to_string(self.cache.total_cost())))
 
-        self.process.finished.connect(self.refresh_finished)
+        statistics = []
+        for name, cache in ((self.tr("Memory"), self.memory_cache), (self.tr("Disk"), self.cache)):
+            statistics.append(self.tr(CACHE_STATISTICS_FORMAT_STRING).format(
+                name, cache_size_to_string(cache.total_cost()), cache.count(),
+                cache.hits, cache.misses, cache.evictions))
+        self.cache_size_label.setToolTip("\n".join(statistics))
 
-        self.process.write(bytearray(current_document, 'utf-8'))
-        self.process.closeWriteChannel()
+    def enable_undo_redo_actions(self):
+        document = self.tab.editor.document()
+        self.undo_action.setEnabled(document.isUndoAvailable())
+        self.redo_action.setEnabled(document.isRedoAvailable())
 
-    def refresh_finished(self):
-        self.cached_image = self.process.readAll()
-        self.image_widget.load(self.cached_image)
-        self.process.deleteLater()
-        self.process = 0;
+    def add_tab(self):
+        tab = DocumentTab(self.tab_widget)
+        tab.editor.document().contentsChanged.connect(lambda: self.on_editor_changed(tab))
+        tab.editor.document().modificationChanged.connect(lambda _: self.update_tab_title(tab))
+        self.tabs.append(tab)
+        self.tab_widget.addTab(tab.editor, "")
+        self.update_tab_title(tab)
+        return tab
+
+    def activate_tab(self, tab):
+        if tab is self.tab:
+            self.on_current_tab_changed(self.tab_widget.currentIndex())
+        else:
+            self.tab_widget.setCurrentWidget(tab.editor)
+
+    def find_tab(self, path):
+        path = os.path.abspath(path)
+        for tab in self.tabs:
+            if tab.document_path is not None and os.path.abspath(tab.document_path) == path:
+                return tab
+        return None
+
+    def update_tab_title(self, tab):
+        name = tab.name() or self.tr("Untitled")
+        index = self.tab_widget.indexOf(tab.editor)
+        self.tab_widget.setTabText(index, name + ("*" if tab.is_modified() else ""))
+        self.tab_widget.setTabToolTip(index, tab.document_path or "")
+        if tab is self.tab:
+            self.setWindowTitle(TITLE_FORMAT_STRING.format(name, qApp.applicationName()))
+            self.setWindowModified(tab.is_modified())
+
+    def update_export_path_info(self):
+        export_path = self.tab.export_path or ""
+        self.export_image_action.setText(self.tr(EXPORT_TO_MENU_FORMAT_STRING).format(export_path))
+        self.export_path_label.setText(self.tr(EXPORT_TO_LABEL_FORMAT_STRING).format(os.path.basename(export_path)))
+        self.export_path_label.setEnabled(self.tab.export_path is not None)
+
+    def on_current_tab_changed(self, index):
+        previous = self.tab
+        self.tab = next((tab for tab in self.tabs if tab.editor is self.tab_widget.widget(index)), None)
+        self.render_server.set_foreground(self.tab)
+        if previous is not None and previous is not self.tab and previous in self.tabs:
+            # An edit not rendered yet is rendered behind the current tab
+            self.auto_refresh_timer.stop()
+            self.refresh(tab=previous)
+        if self.tab is None:
+            return
 
-        if self.use_cache and self.cache:
-            self.cache.add_item(self.cached_image, self.last_key,
-                                lambda path, key, cost, date_date, parent: FileCacheItem(path, key, cost, date_date,
-                                                                                         parent))
+        self.update_tab_title(self.tab)
+        self.update_export_path_info()
+        self.enable_undo_redo_actions()
 
-            self.update_cache_size_info()
+        # The preview shows another document, the cached image of this one is shown again
+        self.tab.last_key = None
+        if not self.refresh_from_cache():
+            self.tab.needs_refresh = True
+            self.refresh()
+        self.update_diagram_selector()
 
-        self.statusBar().showMessage(self.tr("Refreshed"), STATUS_BAR_TIMEOUT)
+    def on_tab_close_requested(self, index):
+        tab = next(tab for tab in self.tabs if tab.editor is self.tab_widget.widget(index))
+        if not self.maybe_save(tab):
+            return
 
-    def update_cache_size_info(self):
-        # TODO
-        pass
+        self.tabs.remove(tab)
+        self.render_server.cancel_pending(tab)
+        if tab is self.tab:
+            self.auto_refresh_timer.stop()
+            self.tab = None
+        self.tab_widget.removeTab(self.tab_widget.indexOf(tab.editor))
+        tab.editor.deleteLater()
+        self.update_watched_files()
 
-    def enable_undo_redo_actions(self):
-        document = self.editor.document()
-        self.undo_action.setEnabled(document.isUndoAvailable())
-        self.redo_action.setEnabled(document.isRedoAvailable())
+        if not self.tabs:
+            self.new_document()
 
     def new_document(self):
-        if not self.maybe_save():
-            return
-
-        self.document_path = None
-        self.export_path = None
-        self.cached_image = None
-
-        # TODO: Export path
-        # m_exportImageAction->setText(tr(EXPORT_TO_MENU_FORMAT_STRING).arg(""));
-        # m_exportPathLabel->setText(tr(EXPORT_TO_LABEL_FORMAT_STRING).arg(""));
-        # m_exportPathLabel->setEnabled(false);
+        tab = self.add_tab()
 
         text = "@startuml\n\nme -> you: Hello!\n\n@enduml"
-        self.editor.setPlainText(text)
-        self.setWindowTitle(TITLE_FORMAT_STRING.format(
-            self.tr("Untitled"),
-            qApp.applicationName()))
-
-        self.setWindowModified(False)
-        self.refresh()
+        tab.editor.setPlainText(text)
+        tab.editor.document().setModified(False)
+        tab.needs_refresh = True
 
-        self.enable_undo_redo_actions()
+        self.activate_tab(tab)
+        self.update_watched_files()
 
     def on_open_document_triggered(self):
         self.open_document()
 
     def open_document(self, name=None):
         qDebug("Open document")
-        if not self.maybe_save():
-            return
         tmp_name = name
         if tmp_name is None or not os.path.exists(tmp_name):
             tmp_name = QFileDialog.getOpenFileName(self,
@@ -532,6 +887,11 @@ class MainWindow(QMainWindow):
                 return
             self.last_dir = os.path.dirname(os.path.abspath(tmp_name))
 
+        tab = self.find_tab(tmp_name)
+        if tab is not None:
+            self.activate_tab(tab)
+            return
+
         try:
             with open(tmp_name, 'r', encoding='utf-8') as f:
                 content = f.readlines()
@@ -539,19 +899,36 @@ class MainWindow(QMainWindow):
         except IOError:
             return
 
+        # A new document nobody typed in is replaced
+        tab = self.tab if self.tab is not None and self.tab.is_untouched() else self.add_tab()
         content = "".join(content)
-        self.editor.setPlainText(content)
-        self.setWindowModified(False)
-
-        self.document_path = tmp_name
-        self.setWindowTitle(TITLE_FORMAT_STRING.format(os.path.basename(tmp_name), qApp.applicationName()))
-        self.needs_refresh = True
-        self.refresh()
+        tab.editor.setPlainText(content)
+        tab.editor.document().setModified(False)
+
+        tab.document_path = tmp_name
+        tab.current_diagram = 0
+        tab.needs_refresh = True
+        self.update_tab_title(tab)
+        self.activate_tab(tab)
+        self.update_watched_files()
         self.recent_documents.accessing(tmp_name)
         qDebug("Opened file {}".format(tmp_name))
 
+    def open_documents(self, paths):
+        """Opens paths in tabs, e.g. forwarded by another instance, and brings the window forward"""
+        for path in paths:
+            if os.path.isfile(path):
+                self.open_document(path)
+        if not self.tabs:
+            self.new_document()
+
+        self.setWindowState(self.windowState() & ~Qt.WindowMinimized)
+        self.show()
+        self.raise_()
+        self.activateWindow()
+
     def on_save_document_triggered(self):
-        self.save_document(self.document_path)
+        self.save_document(self.tab.document_path)
         if self.refresh_on_save:
             self.on_refresh_action_triggered()
 
@@ -560,12 +937,15 @@ class MainWindow(QMainWindow):
 
     def on_export_image_action_triggered(self):
         qDebug("Export to triggered")
-        self.export_image(self.export_path)
+        self.export_image(self.tab.export_path)
 
     def on_export_as_image_action_triggered(self):
         self.export_image(None)
 
     def on_preferences_action_triggered(self):
+        # Loading the .ui files of the dialog is left out of the startup
+        from PreferencesDialog import PreferencesDialog
+
         self.write_settings()
         dialog = PreferencesDialog(self.cache, self)
         dialog.read_settings()
@@ -579,6 +959,7 @@ class MainWindow(QMainWindow):
 
     def save_document(self, name=None):
         qDebug("Saving document {}".format(name))
+        tab = self.tab
         file_path = name
         if file_path is None:
             file_path = QFileDialog.getSaveFileName(self,
@@ -592,10 +973,10 @@ class MainWindow(QMainWindow):
 
         qDebug("saving document in: {}".format(file_path))
         with open(file_path, 'wb') as f:
-            f.write(self.editor.toPlainText().encode('utf-8'))
+            f.write(tab.editor.toPlainText().encode('utf-8'))
 
-        self.document_path = file_path
-        self.setWindowTitle(TITLE_FORMAT_STRING.format(os.path.basename(file_path), qApp.applicationName()))
+        tab.document_path = file_path
+        self.update_watched_files()
         self.statusBar().showMessage(self.tr("Document saved in {}".format(file_path)), STATUS_BAR_TIMEOUT)
         self.recent_documents.accessing(file_path)
 
@@ -606,40 +987,40 @@ class MainWindow(QMainWindow):
             qDebug("saving image in:   {}".format(image_path))
 
             with open(image_path, 'wb') as f:
-                f.write(self.cached_image)
+                f.write(tab.cached_image)
 
-        self.editor.document().setModified(False)
-        self.setWindowModified(False)
+        tab.editor.document().setModified(False)
+        self.update_tab_title(tab)
         return True
 
     def undo(self):
-        document = self.editor.document()
+        document = self.tab.editor.document()
         document.undo()
         self.enable_undo_redo_actions()
 
     def redo(self):
-        document = self.editor.document()
+        document = self.tab.editor.document()
         document.redo()
         self.enable_undo_redo_actions()
 
     def copy_image(self):
         pixmap = QPixmap()
-        pixmap.loadFromData(self.cached_image)
+        pixmap.loadFromData(self.tab.cached_image)
         QApplication.clipboard().setPixmap(pixmap)
         qDebug("Image copy into Clipboard")
 
     def export_image(self, name):
-        if self.cached_image is None:
+        if self.tab.cached_image is None:
             qDebug("no image to export. aborting...")
             return
 
-        if self.document_path is None:
+        if self.tab.document_path is None:
             qDebug("no image to export. aborting...")
             return
 
         doc_path_with_base_filename = os.path.join(
-            os.path.abspath(self.document_path),
-            os.path.basename(self.document_path))
+            os.path.abspath(self.tab.document_path),
+            os.path.basename(self.tab.document_path))
         doc_path_with_base_filename, _ = os.path.splitext(doc_path_with_base_filename)
         doc_path_with_base_filename += ".{}".format(self.image_format_names[self.current_image_format])
 
@@ -657,16 +1038,13 @@ class MainWindow(QMainWindow):
         qDebug("exporting image in: {}".format(tmp_name))
 
         with open(tmp_name, 'wb') as f:
-            f.write(self.cached_image)
-
-        self.export_image_action.setText(self.tr(EXPORT_TO_MENU_FORMAT_STRING.format(tmp_name)))
+            f.write(self.tab.cached_image)
 
-        self.export_path = tmp_name
+        self.tab.export_path = tmp_name
+        self.update_export_path_info()
 
         short_tmp_name = os.path.basename(tmp_name)
         self.statusBar().showMessage(self.tr("Image exported in {}".format(short_tmp_name)), STATUS_BAR_TIMEOUT)
-        self.export_path_label.setText(self.tr(EXPORT_TO_LABEL_FORMAT_STRING.format(short_tmp_name)))
-        self.export_path_label.setEnabled(True)
 
     def about(self):
         QMessageBox.about(self,
@@ -677,20 +1055,133 @@ class MainWindow(QMainWindow):
         QMessageBox.aboutQt(self,
                             self.tr("About {}".format(QApplication.applicationName())))
 
-    def on_editor_changed(self):
+    def on_editor_changed(self, tab):
+        if tab is not self.tab:
+            # Loaded in the background, whoever changed it refreshes it
+            tab.needs_refresh = True
+            return
+
         qDebug("editor changed")
-        if not self.refresh_from_cache():
-            self.needs_refresh = True
+        if self.refresh_from_cache():
+            self.auto_refresh_timer.stop()
+        else:
+            tab.needs_refresh = True
+            self.schedule_auto_refresh()
 
-        self.setWindowModified(True)
         self.enable_undo_redo_actions()
 
+    def on_dependencies_changed(self):
+        if self.tab is None:
+            return
+
+        # Only the diagrams including a changed file get a new key, and are rendered again
+        if not self.refresh_from_cache():
+            self.tab.needs_refresh = True
+            self.schedule_auto_refresh()
+
+    def refresh_background_tabs(self, affected_files):
+        """Renders the other tabs which were reloaded or include one of affected_files"""
+        for tab in self.tabs:
+            if tab is self.tab:
+                continue
+            if tab.needs_refresh or self.dependency_graph.includes_any(tab.fingerprint.include_lines(),
+                                                                        tab.working_directory(), affected_files):
+                tab.needs_refresh = True
+                self.refresh(tab=tab)
+
+    def update_watched_files(self):
+        wanted = set()
+        for tab in self.tabs:
+            wanted.update(path for path, digest in
+                          self.dependency_graph.dependencies(tab.fingerprint.include_lines(),
+                                                             tab.working_directory()).items()
+                          if digest is not None)
+            if tab.document_path is not None:
+                wanted.add(os.path.abspath(tab.document_path))
+
+        watched = set(self.file_watcher.files())
+        if watched - wanted:
+            self.file_watcher.removePaths(list(watched - wanted))
+        # Files replaced by a rename (atomic saves, checkouts) are no longer watched, add them back
+        missing = [path for path in wanted - watched if os.path.exists(path)]
+        if missing:
+            self.file_watcher.addPaths(missing)
+
+    def on_watched_file_changed(self, path):
+        self.changed_files.add(path)
+        self.file_change_timer.start()
+
+    def on_watched_files_changed(self):
+        changed_files = self.changed_files
+        self.changed_files = set()
+        qDebug("files changed on disk: {}".format(", ".join(sorted(changed_files))))
+        # A document is affected by the files it includes and by the files including them
+        affected_files = set(changed_files)
+        for path in changed_files:
+            affected_files.update(self.dependency_graph.dependents(path))
+        for path in changed_files:
+            self.dependency_graph.forget(path)
+
+        for tab in self.tabs:
+            if tab.document_path is None or os.path.abspath(tab.document_path) not in changed_files:
+                continue
+            if tab.is_modified():
+                self.statusBar().showMessage(
+                    self.tr("{} has been changed by another application").format(tab.name()))
+            else:
+                self.reload_document(tab)
+
+        self.update_watched_files()
+        if self.tab is not None and not self.refresh_from_cache():
+            self.tab.needs_refresh = True
+            self.schedule_auto_refresh()
+        self.refresh_background_tabs(affected_files)
+
+    def reload_document(self, tab):
+        try:
+            with open(tab.document_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except (IOError, UnicodeDecodeError):
+            return
+
+        if content == tab.editor.toPlainText():
+            # Saved by us
+            return
+
+        qDebug("reloading {}".format(tab.document_path))
+        position = tab.editor.textCursor().position()
+        scroll = tab.editor.verticalScrollBar().value()
+        tab.editor.setPlainText(content)
+        cursor = tab.editor.textCursor()
+        cursor.setPosition(min(position, len(content)))
+        tab.editor.setTextCursor(cursor)
+        tab.editor.verticalScrollBar().setValue(scroll)
+
+        tab.editor.document().setModified(False)
+        self.update_tab_title(tab)
+        self.statusBar().showMessage(self.tr("{} reloaded").format(tab.name()), STATUS_BAR_TIMEOUT)
+
+    def on_diagram_selected(self, index):
+        if index < 0 or index >= len(self.tab.diagrams):
+            return
+
+        self.tab.current_diagram = index
+        key = self.current_diagram_key()
+        if key != self.tab.last_key:
+            # Shown once rendered if it is not cached yet
+            self.show_cached_diagram(key, RefreshTiming(key))
+
     def on_refresh_action_triggered(self):
-        self.needs_refresh = True
+        self.tab.needs_refresh = True
         self.refresh(True)
 
     def on_auto_refresh_action_toggled(self, state):
-        pass
+        self.autorefresh_enabled = state
+        self.auto_refresh_label.setEnabled(state)
+        if state:
+            self.schedule_auto_refresh()
+        else:
+            self.auto_refresh_timer.stop()
 
     def zoom_in(self, widget):
         pass
@@ -0,0 +1,77 @@
+from collections import OrderedDict
+
+
+class MemoryCacheItem:
+    def __init__(self, key, data, preview, cost):
+        self.key = key
+        self.data = data
+        self.preview = preview
+        self.cost = cost
+
+
+class MemoryCache:
+    """
+    Bounded least-recently-used cache of decoded previews (QImage or
+    QSvgRenderer) together with the raw image data they were decoded from.
+    The preview of an item may be None until it is first shown.
+    """
+
+    def __init__(self, max_cost):
+        self._max_cost = max_cost
+        self._total_cost = 0
+        self._items = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def max_cost(self):
+        return self._max_cost
+
+    def set_max_cost(self, max_cost):
+        self._max_cost = max_cost
+        self.evict()
+
+    def total_cost(self):
+        return self._total_cost
+
+    def count(self):
+        return len(self._items)
+
+    def has_item(self, key):
+        return key in self._items
+
+    def item(self, key):
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._items.move_to_end(key)
+        return item
+
+    def add_item(self, key, data, preview, cost):
+        self.remove_item(key)
+        if cost > self._max_cost:
+            return False
+
+        self._items[key] = MemoryCacheItem(key, data, preview, cost)
+        self._total_cost += cost
+        self.evict()
+        return True
+
+    def remove_item(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._total_cost -= item.cost
+
+    def clear(self):
+        self._items.clear()
+        self._total_cost = 0
+
+    def evict(self):
+        while self._total_cost > self._max_cost and self._items:
+            _, item = self._items.popitem(last=False)
+            self._total_cost -= item.cost
+            self.evictions += 1
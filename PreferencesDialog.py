@@ -1,16 +1,68 @@
+import os
+import re
+import html
+from collections import deque
+
 from PySide6 import QtCore
 from PySide6.QtWidgets import QDialog, QLineEdit, QFileDialog
 from PySide6.QtUiTools import QUiLoader
-from PySide6.QtCore import qDebug, QSettings, QProcess
+from PySide6.QtCore import qDebug, QSettings, QProcess, QObject, QTimer, QByteArray, Signal
 
 from LogDialog import LogDialog
 from SettingsConstants import *
+from Utils import cache_size_to_string, CACHE_SCALE
+
+
+class ProgramCheck(QObject):
+    """Runs a program without blocking and reports whether it succeeded"""
+    done = Signal(bool, str)
+
+    def __init__(self, command, args, validator, timeout, parent=None):
+        super().__init__(parent)
+        self.validator = validator
+        self.output = QByteArray()
+
+        self.process = QProcess(self)
+        self.process.setProcessChannelMode(QProcess.MergedChannels)
+        self.process.readyReadStandardOutput.connect(self.on_ready_read)
+        self.process.finished.connect(self.on_finished)
+        self.process.errorOccurred.connect(self.on_error)
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.on_timeout)
+        self.timer.start(timeout)
+
+        self.process.start(command, args)
+
+    def on_ready_read(self):
+        self.output.append(self.process.readAllStandardOutput())
+
+    def on_finished(self, exit_code, exit_status):
+        self.timer.stop()
+        output = bytes(self.output).decode('utf-8', 'replace')
+        ok = exit_status == QProcess.NormalExit and exit_code == 0
+        if ok and self.validator:
+            ok = re.search(self.validator, output) is not None
+        self.done.emit(ok, output)
+
+    def on_error(self, error):
+        if error == QProcess.FailedToStart:
+            self.timer.stop()
+            self.done.emit(False, self.process.errorString())
+
+    def on_timeout(self):
+        self.process.finished.disconnect(self.on_finished)
+        self.process.kill()
+        self.done.emit(False, "timed out")
 
 
 class PreferencesDialog(QDialog):
     def __init__(self, file_cache, parent):
         super(PreferencesDialog, self).__init__(parent)
         self.file_cache = file_cache
+        self.program_check = None
+        self.check_timeout = SETTINGS_PROCESS_START_TIMEOUT_DEFAULT * TIMEOUT_SCALE
 
         self.ui = QUiLoader.loadUi('PreferencesDialog.ui', self)
 
@@ -56,6 +108,25 @@ class PreferencesDialog(QDialog):
             self.ui.customGraphvizEdit.setText(file_name)
             self.ui.customGraphvizRadio.setChecked(True)
 
+    @QtCore.Slot()
+    def on_customCacheButton_clicked(self):
+        dir_name = QFileDialog.getExistingDirectory(self,
+                                                    self.tr("Select cache directory"),
+                                                    self.ui.customCacheEdit.text())
+        if dir_name:
+            self.ui.customCacheEdit.setText(dir_name)
+            self.ui.customCacheRadio.setChecked(True)
+
+    @QtCore.Slot()
+    def on_clearCacheButton_clicked(self):
+        if self.file_cache:
+            self.file_cache.clear_from_disk()
+            self.update_cache_size_info()
+
+    def update_cache_size_info(self):
+        total_cost = self.file_cache.total_cost() if self.file_cache else 0
+        self.ui.cacheCurrentSizeLabel.setText(cache_size_to_string(total_cost))
+
     @QtCore.Slot()
     def on_checkExternalPrograms_clicked(self):
         self.check_external_programs()
@@ -88,6 +159,20 @@ class PreferencesDialog(QDialog):
         self.ui.customGraphvizEdit.setText(settings.value(SETTINGS_CUSTOM_GRAPHVIZ_PATH,
                                                           SETTINGS_CUSTOM_GRAPHVIZ_PATH_DEFAULT))
 
+        self.check_timeout = int(settings.value(SETTINGS_PROCESS_START_TIMEOUT,
+                                                SETTINGS_PROCESS_START_TIMEOUT_DEFAULT)) * TIMEOUT_SCALE
+
+        self.ui.cacheGroupBox.setChecked(settings.value(SETTINGS_USE_CACHE, SETTINGS_USE_CACHE_DEFAULT, bool))
+        if settings.value(SETTINGS_USE_CUSTOM_CACHE,
+                          SETTINGS_USE_CUSTOM_CACHE_DEFAULT, bool):
+            self.ui.customCacheRadio.setChecked(True)
+        else:
+            self.ui.defaultCacheRadio.setChecked(True)
+        self.ui.customCacheEdit.setText(settings.value(SETTINGS_CUSTOM_CACHE_PATH, ""))
+        self.ui.cacheMaxSize.setValue(int(settings.value(SETTINGS_CACHE_MAX_SIZE,
+                                                         SETTINGS_CACHE_MAX_SIZE_DEFAULT)) // CACHE_SCALE)
+        self.update_cache_size_info()
+
         settings.endGroup()
 
     def write_settings(self):
@@ -102,11 +187,15 @@ class PreferencesDialog(QDialog):
 
         settings.setValue(SETTINGS_USE_CUSTOM_GRAPHVIZ, self.ui.customGraphvizRadio.isChecked())
         settings.setValue(SETTINGS_CUSTOM_GRAPHVIZ_PATH, self.ui.customGraphvizEdit.text())
+
+        settings.setValue(SETTINGS_USE_CACHE, self.ui.cacheGroupBox.isChecked())
+        settings.setValue(SETTINGS_USE_CUSTOM_CACHE, self.ui.customCacheRadio.isChecked())
+        settings.setValue(SETTINGS_CUSTOM_CACHE_PATH, self.ui.customCacheEdit.text())
+        settings.setValue(SETTINGS_CACHE_MAX_SIZE, self.ui.cacheMaxSize.value() * CACHE_SCALE)
         settings.endGroup()
 
     def check_external_programs(self):
         qDebug("Check external programs")
-        log = ""
         java_path = self.ui.customJavaPathEdit.text() \
             if self.ui.customJavaRadio.isChecked() \
             else SETTINGS_CUSTOM_JAVA_PATH_DEFAULT
@@ -115,49 +204,45 @@ class PreferencesDialog(QDialog):
             if self.ui.customGraphvizRadio.isChecked() \
             else SETTINGS_CUSTOM_GRAPHVIZ_PATH_DEFAULT
 
-        invalid_path_log = "<font color=\"red\">invalid path</font>"
-
-        log += "Testing Java executable <tt>{}</tt>: ".format(java_path)
-        is_java_ok = False
-        if os.path.exists(java_path):
-            is_java_ok, log = self.check_external_program(java_path, ["-version"], log)
+        # The checks run one after the other, driven by the processes' signals
+        self.check_log = ""
+        self.pending_checks = deque([
+            ("Testing Java executable <tt>{}</tt>: ".format(java_path), java_path, ["-version"], None),
+            ("<p>Testing graphiz/dot <tt>{}</tt>: ".format(graphviz_path), graphviz_path, ["-V"],
+             ".*dot - graphviz version.*"),
+        ])
+        self.ui.checkExternalPrograms.setEnabled(False)
+        self.run_next_check()
+
+    def run_next_check(self):
+        if not self.pending_checks:
+            self.ui.checkExternalPrograms.setEnabled(True)
+            self.show_log(self.check_log)
+            return
+
+        label, command, args, validator = self.pending_checks.popleft()
+        self.check_log += label
+        if not os.path.exists(command):
+            self.check_log += "<font color=\"red\">invalid path</font>"
+            self.run_next_check()
+            return
+
+        self.program_check = ProgramCheck(command, args, validator, self.check_timeout, self)
+        self.program_check.done.connect(self.on_program_check_done)
+
+    def on_program_check_done(self, ok, output):
+        self.program_check.deleteLater()
+        self.program_check = None
+
+        if ok:
+            self.check_log += "<b><font color=\"green\">OK</font></b>"
         else:
-            log += invalid_path_log
-
-        log += "<p>"
-        log += "Testing graphiz/dot <tt>{}</tt>: ".format(graphviz_path)
-
-        is_graphviz_ok = False
-        if not os.path.exists(graphviz_path):
-            log += invalid_path_log
-        else:
-            is_graphviz_ok, log = self.check_external_program(graphviz_path, ["-V"], log,
-                                                              ".*dot - graphviz version.*")
-
-        if is_java_ok and is_graphviz_ok:
-            pass
-
-        self.show_log(log)
-
-    def check_external_program(self, command, args, log, validator=None):
-        process = QProcess()
-        process.start(command, args)
-        process.waitForFinished()
-
-        output = process.readAllStandardOutput() + process.readAllStandardError()
-
-        if process.exitCode() == 0:
-            validation_ok = True
-
-            if validation_ok:
-                log += "<b><font color=\"green\">OK</font></b>"
-                return True, log
+            self.check_log += "<font color=\"red\">FAILED</font>"
+            self.check_log += "<pre>"
+            self.check_log += html.escape(output)
+            self.check_log += "</pre>"
 
-        log += "<font color=\"red\">FAILED</font>"
-        log += "<pre>"
-        log += output
-        log += "</pre>"
-        return False, log
+        self.run_next_check()
 
     def show_log(self, log):
         if log:
@@ -1,7 +1,12 @@
+from collections import OrderedDict
+
 from PySide6.QtWidgets import QWidget
-from PySide6.QtGui import QImage, QPainter
-from PySide6.QtCore import QSize, QRect, QPoint, Qt
-from PySide6.QtSvg import QSvgRenderer
+from PySide6.QtGui import QImage, QPainter, QPixmap
+from PySide6.QtCore import QSize, QRect, QRectF, QPoint, Qt, Signal
+
+from RenderTiming import now
+from BackgroundTasks import BackgroundTasks
+from ZoomPyramid import ZoomPyramid, scale_tile, refine_tiles
 
 ZOOM_ORIGINAL_SCALE = 100
 ZOOM_BIG_INCREMENT = 100  # used when m_zoomScale > ZOOM_ORIGINAL_SCALE
@@ -9,6 +14,9 @@ ZOOM_SMALL_INCREMENT = 20  # used when m_zoomScale < ZOOM_ORIGINAL_SCALE
 MAX_ZOOM_SCALE = 900
 MIN_ZOOM_SCALE = 10
 
+TILE_SIZE = 256  # in pixels
+DEFAULT_ZOOM_CACHE_COST = 64 * 1024 * 1024  # in bytes, shared by the zoom pyramid and the tiles
+
 
 class Mode:
     NoMode = 0
@@ -16,29 +24,106 @@ class Mode:
     SvgMode = 2
 
 
+def tile_cost(tile):
+    return tile.width() * tile.height() * tile.depth() // 8
+
+
+def device_rect(rect, device_pixel_ratio):
+    return QRect(int(rect.x() * device_pixel_ratio), int(rect.y() * device_pixel_ratio),
+                 int(rect.width() * device_pixel_ratio), int(rect.height() * device_pixel_ratio))
+
+
+def make_svg_renderer(data=None):
+    # QtSvg is only loaded once an SVG preview is needed, it is not part of the startup
+    from PySide6.QtSvg import QSvgRenderer
+    return QSvgRenderer(data) if data is not None else QSvgRenderer()
+
+
+def rasterize_svg(data, size):
+    """Renders SVG data in an image of the given size, meant to run in a worker thread"""
+    image = QImage(size, QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.transparent)
+    renderer = make_svg_renderer(data)
+    painter = QPainter(image)
+    renderer.render(painter, QRectF(0, 0, size.width(), size.height()))
+    painter.end()
+    return image
+
+
 class PreviewWindow(QWidget):
+    painted = Signal(float)  # duration of the paint event in miliseconds
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.mode = Mode.NoMode
         self.image = QImage()
-        self.zoomed_image = QImage()
-        self.svgRenderer = QSvgRenderer(self)
+        self.svgRenderer = None
         self.zoom_scale = ZOOM_ORIGINAL_SCALE
+        self.zoom_cache_cost = DEFAULT_ZOOM_CACHE_COST
+        self.pyramid = ZoomPyramid(self.image, self.zoom_cache_cost // 2)
+        self.key = None
+        self.svg_data = None
+
+        # Rasterized SVG previews, keyed by (document key, zoom scale, device pixel ratio)
+        self.svg_rasters = OrderedDict()
+        self.svg_rasters_cost = 0
+        self.pending_rasters = set()
+
+        # Rendered tiles of the preview, keyed by (zoom scale, column, row)
+        self.tiles = OrderedDict()
+        self.tiles_cost = 0
+        self.tiles_device_pixel_ratio = self.devicePixelRatioF()
+        # Tiles drawn with a fast transformation, waiting for their smooth version
+        self.draft_tiles = set()
+        self.generation = 0
+        self.background_tasks = BackgroundTasks(parent=self)
 
     def mode(self):
         return self.mode
 
+    def set_zoom_cache_cost(self, cost):
+        """Memory budget in bytes of the zoom pyramid and the rendered tiles"""
+        self.zoom_cache_cost = cost
+        self.pyramid = ZoomPyramid(self.image, cost // 2)
+        self.svg_rasters.clear()
+        self.svg_rasters_cost = 0
+        self.clear_tiles()
+        self.update()
+
     def set_mode(self, mode):
-        self.mode = mode
+        if self.mode != mode:
+            self.mode = mode
+            self.clear_tiles()
+
+    def decode(self, data):
+        """Decode image data for the current mode, returns the preview and its cost in bytes"""
+        if self.mode == Mode.PngMode:
+            image = QImage()
+            image.loadFromData(data)
+            return image, image.sizeInBytes()
+        elif self.mode == Mode.SvgMode:
+            renderer = make_svg_renderer()
+            renderer.load(data)
+            return renderer, len(data)
+
+        return None, 0
 
-    def load(self, data):
+    def set_preview(self, preview, key=None, data=None):
+        """
+        Shows a decoded preview. key identifies the document, SVG previews are
+        only rasterized in the background when it is given.
+        """
+        self.key = key
         if self.mode == Mode.PngMode:
-            self.image.loadFromData(data)
-            self.setMinimumSize(self.image.rect().size())
+            self.image = preview
+            self.svg_data = None
         elif self.mode == Mode.SvgMode:
-            self.svgRenderer.load(data)
+            self.svgRenderer = preview
+            self.svg_data = data
 
-        self.zoom_image()
+        self.pyramid = ZoomPyramid(self.image, self.zoom_cache_cost // 2)
+        self.clear_tiles()
+        self.setMinimumSize(self.output_size())
         self.update()
 
     # Public slots
@@ -63,39 +148,194 @@ class PreviewWindow(QWidget):
 
     # Private methods
 
+    def zoom(self):
+        return float(self.zoom_scale) / ZOOM_ORIGINAL_SCALE
+
+    def output_size(self):
+        if self.mode == Mode.PngMode:
+            size = self.image.size()
+        elif self.mode == Mode.SvgMode and self.svgRenderer is not None:
+            size = self.svgRenderer.defaultSize()
+        else:
+            return QSize()
+
+        return QSize(int(size.width() * self.zoom()), int(size.height() * self.zoom()))
+
     def paintEvent(self, event):
+        start = now()
+        if self.devicePixelRatioF() != self.tiles_device_pixel_ratio:
+            self.clear_tiles()
+            self.tiles_device_pixel_ratio = self.devicePixelRatioF()
+
         painter = QPainter(self)
-        output_size = QSize()
 
-        if self.mode == Mode.PngMode:
-            output_size = self.zoomed_image.size()
-            output_rect = QRect(QPoint(), output_size)
-            output_rect.translate(self.rect().center() - output_rect.center())
-            painter.drawImage(output_rect.topLeft(), self.zoomed_image)
+        output_size = self.output_size()
+        output_rect = QRect(QPoint(), output_size)
+        output_rect.translate(self.rect().center() - output_rect.center())
 
-        elif self.mode == Mode.SvgMode:
-            output_size = self.svgRenderer.defaultSize()
-            if self.zoom_scale != ZOOM_ORIGINAL_SCALE:
-                zoom = float(self.zoom_scale) / ZOOM_ORIGINAL_SCALE
-                output_size.scale(output_size.width() * zoom, output_size.height() * zoom, Qt.IgnoreAspectRatio)
+        # Only the tiles intersecting the exposed region are drawn
+        exposed = event.rect().intersected(output_rect).translated(-output_rect.topLeft())
+        if self.mode != Mode.NoMode and not exposed.isEmpty():
+            for row in range(exposed.top() // TILE_SIZE, exposed.bottom() // TILE_SIZE + 1):
+                for column in range(exposed.left() // TILE_SIZE, exposed.right() // TILE_SIZE + 1):
+                    tile = self.tile(column, row, output_size)
+                    painter.drawPixmap(output_rect.left() + column * TILE_SIZE,
+                                       output_rect.top() + row * TILE_SIZE, tile)
+
+        self.refine_draft_tiles()
+        painter.end()
+        self.painted.emit(now() - start)
 
-            output_rect = QRect(QPoint(), output_size)
-            output_rect.translate(self.rect().center() - output_rect.center())
-            self.svgRenderer.render(painter, output_rect)
+    def tile(self, column, row, output_size):
+        key = (self.zoom_scale, column, row)
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            return tile
 
-        self.setMinimumSize(output_size)
+        tile_rect = QRect(column * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE) \
+            .intersected(QRect(QPoint(), output_size))
 
-    def zoom_image(self):
         if self.mode == Mode.PngMode:
             if self.zoom_scale == ZOOM_ORIGINAL_SCALE:
-                self.zoomed_image = self.image
+                tile = QPixmap.fromImage(self.image.copy(tile_rect))
+            else:
+                # Fast preview scale now, the smooth one is computed in the background
+                level, level_scale = self.pyramid.level_for(self.zoom(), False)
+                tile = QPixmap.fromImage(scale_tile(level, level_scale, self.zoom(), tile_rect, False))
+                self.draft_tiles.add((key, tile_rect.getRect()))
+        else:
+            tile = self.svg_tile(tile_rect, output_size)
+
+        self.insert_tile(key, tile)
+        return tile
+
+    def svg_tile(self, tile_rect, output_size):
+        device_pixel_ratio = self.devicePixelRatioF()
+        source_rect = device_rect(tile_rect, device_pixel_ratio)
+
+        raster = self.svg_raster(output_size)
+        draft = None
+        if raster is None and (self.key, self.zoom_scale, device_pixel_ratio) in self.pending_rasters:
+            # While the zoom level is rasterized, scale the closest one we already have
+            draft = self.closest_svg_raster()
+
+        if raster is not None:
+            tile = QPixmap.fromImage(raster.copy(source_rect))
+        else:
+            if draft is not None:
+                raster, raster_scale = draft
+                tile = QPixmap.fromImage(scale_tile(raster, raster_scale, self.zoom_scale, source_rect, False))
             else:
-                zoom = float(self.zoom_scale) / ZOOM_ORIGINAL_SCALE
-                self.zoomed_image = self.image.scaled(self.image.width() * zoom, self.image.height() * zoom,
-                                                      Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+                tile = QPixmap(source_rect.size())
+                tile.fill(Qt.transparent)
+                painter = QPainter(tile)
+                painter.scale(device_pixel_ratio, device_pixel_ratio)
+                painter.translate(-tile_rect.topLeft())
+                self.svgRenderer.render(painter, QRectF(0, 0, output_size.width(), output_size.height()))
+                painter.end()
+
+        tile.setDevicePixelRatio(device_pixel_ratio)
+        return tile
+
+    def svg_raster(self, output_size):
+        """
+        Rasterized SVG at the current zoom level, None while it is rendered in
+        the background or if it does not fit in the zoom cache.
+        """
+        raster_key = (self.key, self.zoom_scale, self.devicePixelRatioF())
+        raster = self.svg_rasters.get(raster_key)
+        if raster is not None:
+            self.svg_rasters.move_to_end(raster_key)
+            return raster
+
+        if self.key is None or self.svg_data is None or raster_key in self.pending_rasters:
+            return None
+
+        size = QSize(int(output_size.width() * self.devicePixelRatioF()),
+                     int(output_size.height() * self.devicePixelRatioF()))
+        if size.isEmpty() or size.width() * size.height() * 4 > self.zoom_cache_cost // 2:
+            return None
+
+        self.pending_rasters.add(raster_key)
+        self.background_tasks.submit(lambda image: self.on_svg_rasterized(raster_key, image),
+                                     rasterize_svg, self.svg_data, size)
+        return None
+
+    def closest_svg_raster(self):
+        """Returns (raster, zoom scale) of the current document closest to the current zoom"""
+        closest = None
+        for (key, zoom_scale, device_pixel_ratio), raster in self.svg_rasters.items():
+            if key != self.key or device_pixel_ratio != self.devicePixelRatioF():
+                continue
+            if closest is None or abs(zoom_scale - self.zoom_scale) < abs(closest[1] - self.zoom_scale):
+                closest = (raster, zoom_scale)
+        return closest
+
+    def on_svg_rasterized(self, raster_key, raster):
+        self.pending_rasters.discard(raster_key)
+        if raster.isNull():
+            return
+
+        self.svg_rasters[raster_key] = raster
+        self.svg_rasters_cost += raster.sizeInBytes()
+        while self.svg_rasters_cost > self.zoom_cache_cost // 2 and len(self.svg_rasters) > 1:
+            _, evicted = self.svg_rasters.popitem(last=False)
+            self.svg_rasters_cost -= evicted.sizeInBytes()
+
+        key, zoom_scale, device_pixel_ratio = raster_key
+        if self.mode == Mode.SvgMode and key == self.key and zoom_scale == self.zoom_scale:
+            # Drafts of this zoom level are replaced by pieces of the raster
+            for tile_key in [k for k in self.tiles if k[0] == zoom_scale]:
+                self.tiles_cost -= tile_cost(self.tiles.pop(tile_key))
+            self.update()
+
+    def insert_tile(self, key, tile):
+        previous = self.tiles.pop(key, None)
+        if previous is not None:
+            self.tiles_cost -= tile_cost(previous)
+
+        self.tiles[key] = tile
+        self.tiles_cost += tile_cost(tile)
+        max_tiles_cost = self.zoom_cache_cost - self.pyramid.cost - self.svg_rasters_cost
+        while self.tiles_cost > max_tiles_cost and len(self.tiles) > 1:
+            _, evicted = self.tiles.popitem(last=False)
+            self.tiles_cost -= tile_cost(evicted)
+
+    def clear_tiles(self):
+        self.tiles.clear()
+        self.tiles_cost = 0
+        self.draft_tiles.clear()
+        # Results of running refiners are ignored from now on
+        self.generation += 1
+
+    def refine_draft_tiles(self):
+        if not self.draft_tiles:
+            return
+
+        generation = self.generation
+        self.background_tasks.submit(lambda tiles: self.on_tiles_refined(generation, tiles),
+                                     refine_tiles, self.pyramid, self.zoom(), list(self.draft_tiles))
+        self.draft_tiles.clear()
+
+    def on_tiles_refined(self, generation, tiles):
+        if generation != self.generation:
+            return
+
+        output_rect = QRect(QPoint(), self.output_size())
+        output_rect.translate(self.rect().center() - output_rect.center())
+        for key, image in tiles:
+            if key not in self.tiles:
+                continue
+
+            self.insert_tile(key, QPixmap.fromImage(image))
+            zoom_scale, column, row = key
+            if zoom_scale == self.zoom_scale:
+                self.update(QRect(output_rect.left() + column * TILE_SIZE, output_rect.top() + row * TILE_SIZE,
+                                  image.width(), image.height()))
 
     def set_zoom_scale(self, new_scale):
         if self.zoom_scale != new_scale:
             self.zoom_scale = new_scale
-            self.zoom_image()
+            self.setMinimumSize(self.output_size())
             self.update()
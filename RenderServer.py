@@ -0,0 +1,390 @@
+from collections import deque, OrderedDict
+
+from PySide6.QtCore import QObject, QProcess, QByteArray, QElapsedTimer, QTimer, Signal, qDebug
+
+from SettingsConstants import *
+from RenderTiming import STAGE_SPAWN, STAGE_FIRST_BYTE, STAGE_RENDER
+
+PIPE_DELIMITER = "__DIAGRAM_EDITOR_PIPE_DELIMITER__"
+MAX_RESTART_ATTEMPTS = 3
+STOP_TIMEOUT = 1000  # in miliseconds, before a stopped process gets killed
+
+
+def parse_diagrams(document):
+    """
+    Splits a document in its @start/@end blocks, returns (diagrams, error).
+    diagrams is a list of (name, block), name is what follows the @start
+    directive (usually empty), text outside of the blocks is ignored like
+    PlantUML does. error tells why the document cannot go through the pipe,
+    None if it can: PlantUML answers once per complete block, a @start inside
+    a block or a block never closed would leave it waiting for more input.
+    """
+    diagrams = []
+    name = None
+    block = None
+    first = 0
+    for number, line in enumerate(document.splitlines(keepends=True)):
+        stripped = line.strip()
+        if stripped.startswith("@start"):
+            if block is not None:
+                return diagrams, "line {}: @start inside the diagram started on line {}".format(number + 1, first + 1)
+            directive = stripped.split(None, 1)
+            name = directive[1] if len(directive) > 1 else ""
+            block = [line]
+            first = number
+        elif block is not None:
+            block.append(line)
+            if stripped.startswith("@end"):
+                diagrams.append((name, "".join(block)))
+                block = None
+
+    if block is not None:
+        return diagrams, "line {}: diagram never closed by @end".format(first + 1)
+    return diagrams, None
+
+
+def split_diagrams(document):
+    """The complete @start/@end blocks of a document, as a list of (name, block)"""
+    return parse_diagrams(document)[0]
+
+
+class RenderJob:
+    def __init__(self, key, document, working_directory):
+        self.key = key
+        self.document = document if document.endswith("\n") else document + "\n"
+        self.working_directory = working_directory
+        diagrams, self.error = parse_diagrams(document)
+        self.expected = len(diagrams)
+        self.images = []
+        self.timer = QElapsedTimer()
+        self.spawned = False
+        self.first_byte_time = None
+
+
+class RenderServer(QObject):
+    """
+    Keeps a single PlantUML process alive in "-pipe" mode and streams
+    documents through it. PlantUML writes PIPE_DELIMITER after every
+    diagram, which is used to split stdout back into images.
+
+    schedule() has "latest wins" semantics: while a job is being rendered at
+    most one group of jobs is kept pending per owner (an editor tab), and
+    scheduling a new one replaces it. The pending jobs of the foreground
+    owner are submitted first, the ones of the other owners are submitted
+    one document at a time, so they never delay the foreground for long.
+
+    Nothing blocks: the process is started asynchronously (writes are
+    buffered by QProcess until it runs), stdout is read as it arrives and
+    start-up and render timeouts are handled with timers.
+    """
+    finished = Signal(str, list)
+    failed = Signal(str, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.java_path = None
+        self.plantuml_path = None
+        self.image_format = None
+        self.working_directory = None
+        self.process = None
+        self.buffer = QByteArray()
+        self.jobs = deque()
+        # Submitted for another working directory while jobs were in flight,
+        # written once the process is restarted in it
+        self.deferred_jobs = deque()
+        # owner -> (documents, working directory), oldest first
+        self.pending_jobs = OrderedDict()
+        self.foreground = None
+        self.restart_attempts = 0
+        self.last_render_time = 0  # in miliseconds
+        self.last_timings = {}
+        self.last_spawn_time = 0
+        self.spawn_timer = QElapsedTimer()
+        self.delimiter = QByteArray(PIPE_DELIMITER.encode('utf-8'))
+
+        self.start_timer = QTimer(self)
+        self.start_timer.setSingleShot(True)
+        self.start_timer.setInterval(SETTINGS_PROCESS_START_TIMEOUT_DEFAULT * TIMEOUT_SCALE)
+        self.start_timer.timeout.connect(self.on_start_timeout)
+
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.setInterval(SETTINGS_RENDER_TIMEOUT_DEFAULT * TIMEOUT_SCALE)
+        self.render_timer.timeout.connect(self.on_render_timeout)
+
+    def configure(self, java_path, plantuml_path, image_format):
+        if (java_path, plantuml_path, image_format) != (self.java_path, self.plantuml_path, self.image_format):
+            self.java_path = java_path
+            self.plantuml_path = plantuml_path
+            self.image_format = image_format
+            # The renders in progress are started again with the new settings
+            for job in self.stop():
+                self.submit(job.key, job.document, job.working_directory)
+
+    def set_timeouts(self, start_timeout, render_timeout):
+        """Timeouts in miliseconds"""
+        self.start_timer.setInterval(start_timeout)
+        self.render_timer.setInterval(render_timeout)
+
+    def is_rendering(self, key):
+        return any(job.key == key for job in self.jobs) or any(job.key == key for job in self.deferred_jobs)
+
+    def set_foreground(self, owner):
+        """The pending jobs of owner are submitted before the ones of the other owners"""
+        self.foreground = owner
+
+    def schedule(self, key, document, working_directory, owner=None):
+        return self.schedule_many([(key, document)], working_directory, owner)
+
+    def schedule_many(self, documents, working_directory, owner=None):
+        if owner in self.pending_jobs:
+            qDebug("superseding pending render of {} documents".format(len(self.pending_jobs[owner][0])))
+            del self.pending_jobs[owner]
+        self.pending_jobs[owner] = (documents, working_directory)
+
+        if not self.jobs:
+            return self.submit_pending()
+        return True
+
+    def cancel_pending(self, owner=None):
+        self.pending_jobs.pop(owner, None)
+
+    def submit_pending(self):
+        submitted = False
+        if self.deferred_jobs and not self.jobs:
+            working_directory = self.deferred_jobs[0].working_directory
+            jobs = []
+            while self.deferred_jobs and self.deferred_jobs[0].working_directory == working_directory:
+                jobs.append(self.deferred_jobs.popleft())
+            self.write_jobs(jobs, working_directory)
+            submitted = True
+
+        while self.pending_jobs and not self.jobs:
+            owner = self.foreground if self.foreground in self.pending_jobs else next(iter(self.pending_jobs))
+            documents, working_directory = self.pending_jobs.pop(owner)
+            if owner != self.foreground and len(documents) > 1:
+                # The others keep their turn, the foreground only waits for one document
+                self.pending_jobs[owner] = (documents[1:], working_directory)
+                self.pending_jobs.move_to_end(owner, last=False)
+                documents = documents[:1]
+            submitted = self.submit_many(documents, working_directory) or submitted
+        return submitted
+
+    def submit(self, key, document, working_directory):
+        return self.submit_many([(key, document)], working_directory)
+
+    def submit_many(self, documents, working_directory):
+        """
+        Streams several (key, document) pairs to PlantUML with a single write,
+        finished is emitted once for every document, in order.
+        """
+        jobs = []
+        for key, document in documents:
+            job = RenderJob(key, document, working_directory)
+            if job.error is not None:
+                # Never written to the pipe, the process would wait for the missing @end
+                self.failed.emit(key, job.error)
+            elif job.expected == 0:
+                self.failed.emit(key, "no @start directive found")
+            else:
+                jobs.append(job)
+
+        if not jobs:
+            return False
+
+        if self.jobs and (self.deferred_jobs or working_directory != self.working_directory):
+            # The process in flight runs in another working directory, or other
+            # jobs already wait for the next one: keeps the order
+            self.deferred_jobs.extend(jobs)
+            return True
+
+        self.write_jobs(jobs, working_directory)
+        return True
+
+    def write_jobs(self, jobs, working_directory):
+        if self.process is not None and working_directory != self.working_directory:
+            # Relative !include paths are resolved against the working directory
+            self.stop_process()
+
+        self.ensure_started(working_directory)
+        spawned = self.process.state() != QProcess.Running
+
+        for job in jobs:
+            job.timer.start()
+            job.spawned = spawned
+        if not self.jobs:
+            self.render_timer.start()
+        self.jobs.extend(jobs)
+        self.process.write(bytearray("".join(job.document for job in jobs), 'utf-8'))
+
+    def stop(self, wait=False):
+        """
+        Lets the process exit once its input is consumed. Only waits for it
+        when wait is set, which is meant for headless use. The jobs it was
+        rendering or waiting to render are dropped without any signal and
+        returned.
+        """
+        jobs = self.take_jobs()
+        self.stop_process(wait)
+        return jobs
+
+    def stop_process(self, wait=False):
+        process = self.detach_process()
+        if process is None:
+            return
+
+        process.finished.connect(process.deleteLater)
+        process.closeWriteChannel()
+        if wait:
+            if not process.waitForFinished(STOP_TIMEOUT):
+                process.kill()
+                process.waitForFinished(STOP_TIMEOUT)
+        else:
+            QTimer.singleShot(STOP_TIMEOUT, process, process.kill)
+
+    def take_jobs(self):
+        self.render_timer.stop()
+        jobs = list(self.jobs) + list(self.deferred_jobs)
+        self.jobs.clear()
+        self.deferred_jobs.clear()
+        return jobs
+
+    def kill(self):
+        process = self.detach_process()
+        if process is None:
+            return
+
+        process.finished.connect(process.deleteLater)
+        process.errorOccurred.connect(process.deleteLater)
+        process.kill()
+
+    def detach_process(self):
+        process = self.process
+        if process is None:
+            return None
+
+        self.process = None
+        self.buffer.clear()
+        self.start_timer.stop()
+        process.started.disconnect(self.on_process_started)
+        process.readyReadStandardOutput.disconnect(self.on_ready_read)
+        process.finished.disconnect(self.on_process_finished)
+        process.errorOccurred.disconnect(self.on_process_error)
+        return process
+
+    def ensure_started(self, working_directory):
+        if self.process is not None:
+            return
+
+        arguments = ['-jar', self.plantuml_path, '-t%s' % self.image_format,
+                     "-charset", "UTF-8", "-pipe", "-pipedelimitor", PIPE_DELIMITER]
+
+        self.working_directory = working_directory
+        self.buffer.clear()
+        self.process = QProcess(self)
+        if working_directory:
+            self.process.setWorkingDirectory(working_directory)
+        self.process.started.connect(self.on_process_started)
+        self.process.readyReadStandardOutput.connect(self.on_ready_read)
+        self.process.finished.connect(self.on_process_finished)
+        self.process.errorOccurred.connect(self.on_process_error)
+
+        qDebug("starting PlantUML render server")
+        self.start_timer.start()
+        self.spawn_timer.start()
+        self.process.start(self.java_path, arguments)
+
+    def fail_all(self, message):
+        self.render_timer.stop()
+        # The deferred jobs would start the same process again
+        for job in self.take_jobs():
+            self.failed.emit(job.key, message)
+        self.restart_attempts = 0
+
+    def on_process_started(self):
+        self.start_timer.stop()
+        self.last_spawn_time = self.spawn_timer.nsecsElapsed() / 1e6
+
+    def on_ready_read(self):
+        self.buffer.append(self.process.readAllStandardOutput())
+        if self.jobs and self.jobs[0].first_byte_time is None:
+            self.jobs[0].first_byte_time = self.jobs[0].timer.nsecsElapsed() / 1e6
+
+        while self.jobs:
+            index = self.buffer.indexOf(self.delimiter)
+            if index < 0:
+                break
+
+            image = self.buffer.left(index)
+            end = index + self.delimiter.size()
+            # PlantUML terminates the delimiter with a line separator
+            while end < self.buffer.size() and self.buffer.at(end) in ('\r', '\n'):
+                end += 1
+            self.buffer.remove(0, end)
+
+            job = self.jobs[0]
+            job.images.append(image)
+            self.render_timer.start()
+            if len(job.images) >= job.expected:
+                self.jobs.popleft()
+                if not self.jobs:
+                    self.render_timer.stop()
+                self.restart_attempts = 0
+                self.last_render_time = job.timer.elapsed()
+                self.last_timings = {
+                    STAGE_SPAWN: self.last_spawn_time if job.spawned else 0.0,
+                    STAGE_FIRST_BYTE: job.first_byte_time,
+                    STAGE_RENDER: job.timer.nsecsElapsed() / 1e6,
+                }
+                self.finished.emit(job.key, job.images)
+                self.submit_pending()
+
+    def on_process_finished(self, exit_code, exit_status):
+        qDebug("render server exited with code {}".format(exit_code))
+        self.detach_process().deleteLater()
+        self.render_timer.stop()
+
+        if not self.jobs:
+            self.submit_pending()
+            return
+
+        if self.restart_attempts >= MAX_RESTART_ATTEMPTS:
+            self.fail_all("PlantUML process crashed")
+            self.submit_pending()
+            return
+
+        self.restart_attempts += 1
+        self.resubmit_jobs()
+
+    def on_process_error(self, error):
+        if error != QProcess.FailedToStart:
+            # Crashes are handled when the process finishes
+            return
+
+        qDebug("render server failed to start")
+        self.detach_process().deleteLater()
+        self.fail_all("PlantUML process failed to start")
+        self.submit_pending()
+
+    def on_start_timeout(self):
+        qDebug("render server did not start in time")
+        self.kill()
+        self.fail_all("PlantUML process did not start in time")
+        self.submit_pending()
+
+    def on_render_timeout(self):
+        if not self.jobs:
+            return
+
+        # The process is probably hung: drop the job it is working on and
+        # restart it for the others
+        job = self.jobs.popleft()
+        qDebug("render of {} timed out".format(job.key))
+        self.kill()
+        self.failed.emit(job.key, "PlantUML did not answer in time")
+        self.resubmit_jobs()
+        self.submit_pending()
+
+    def resubmit_jobs(self):
+        for job in self.take_jobs():
+            self.submit(job.key, job.document, job.working_directory)
@@ -0,0 +1,121 @@
+import json
+import time
+from collections import deque
+
+from PySide6.QtCore import QObject, Signal
+
+MAX_TIMING_RECORDS = 200
+
+STAGE_HASH = "hash"
+STAGE_CACHE_LOOKUP = "cache_lookup"
+STAGE_SPAWN = "spawn"
+STAGE_FIRST_BYTE = "first_byte"
+STAGE_RENDER = "render"
+STAGE_DECODE = "decode"
+STAGE_PAINT = "paint"
+STAGE_TOTAL = "total"
+
+STAGES = [STAGE_HASH, STAGE_CACHE_LOOKUP, STAGE_SPAWN, STAGE_FIRST_BYTE,
+          STAGE_RENDER, STAGE_DECODE, STAGE_PAINT, STAGE_TOTAL]
+
+SOURCE_RENDER = "render"
+SOURCE_MEMORY_CACHE = "memory"
+SOURCE_DISK_CACHE = "disk"
+
+
+def now():
+    """Current time in miliseconds, only meaningful for differences"""
+    return time.perf_counter() * 1000.0
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of values, p between 0 and 100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+class RefreshTiming:
+    """Durations (in miliseconds) of the stages of a single refresh"""
+
+    def __init__(self, key=None):
+        self.key = key
+        self.source = SOURCE_RENDER
+        self.timestamp = time.time()
+        self.started = now()
+        self.stages = {}
+        self._stage_start = self.started
+
+    def begin_stage(self):
+        self._stage_start = now()
+
+    def end_stage(self, stage):
+        end = now()
+        self.stages[stage] = self.stages.get(stage, 0.0) + end - self._stage_start
+        self._stage_start = end
+
+    def set_stage(self, stage, duration):
+        self.stages[stage] = duration
+
+    def finish(self):
+        self.stages[STAGE_TOTAL] = now() - self.started
+
+    def to_dict(self):
+        return {
+            "key": self.key,
+            "source": self.source,
+            "timestamp": self.timestamp,
+            "stages": self.stages,
+        }
+
+
+class RenderTimingLog(QObject):
+    """Rolling log of the last MAX_TIMING_RECORDS refresh timings"""
+    changed = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.records = deque(maxlen=MAX_TIMING_RECORDS)
+
+    def add(self, record):
+        self.records.append(record)
+        self.changed.emit()
+
+    def clear(self):
+        self.records.clear()
+        self.changed.emit()
+
+    def values(self, stage):
+        return [r.stages[stage] for r in self.records if stage in r.stages]
+
+    def statistics(self, stage):
+        values = self.values(stage)
+        if not values:
+            return None
+        return {
+            "last": values[-1],
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "max": max(values),
+            "count": len(values),
+        }
+
+    def histogram(self, stage, bins):
+        """Returns (bin width, counts) of the values of stage"""
+        values = self.values(stage)
+        if not values:
+            return 0.0, [0] * bins
+
+        width = max(values) / bins or 1.0
+        counts = [0] * bins
+        for value in values:
+            counts[min(bins - 1, int(value / width))] += 1
+        return width, counts
+
+    def to_json(self):
+        return json.dumps({
+            "statistics": {stage: self.statistics(stage) for stage in STAGES},
+            "records": [r.to_dict() for r in self.records],
+        }, indent=2)
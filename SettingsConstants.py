@@ -8,7 +8,9 @@ SETTINGS_SHOW_STATUSBAR = "show_statusbar"
 
 SETTINGS_AUTOREFRESH_ENABLED = "autorefresh_enabled"
 SETTINGS_AUTOREFRESH_TIMEOUT = "autorefresh_timeout"
-SETTINGS_AUTOREFRESH_TIMEOUT_DEFAULT = 5000  # in miliseconds
+SETTINGS_AUTOREFRESH_TIMEOUT_DEFAULT = 5000  # in miliseconds, upper bound of the debounce delay
+SETTINGS_AUTOREFRESH_MIN_DELAY = "autorefresh_min_delay"
+SETTINGS_AUTOREFRESH_MIN_DELAY_DEFAULT = 300  # in miliseconds
 
 SETTINGS_AUTOSAVE_IMAGE_ENABLED = "autosave_image_enabled"
 SETTINGS_AUTOSAVE_IMAGE_ENABLED_DEFAULT = False
@@ -29,6 +31,11 @@ SETTINGS_CUSTOM_GRAPHVIZ_PATH = "custom_graphviz"
 
 SETTINGS_ASSISTANT_XML_PATH = "assistant_xml"
 
+SETTINGS_PROCESS_START_TIMEOUT = "process_start_timeout"
+SETTINGS_PROCESS_START_TIMEOUT_DEFAULT = 10  # in seconds
+SETTINGS_RENDER_TIMEOUT = "render_timeout"
+SETTINGS_RENDER_TIMEOUT_DEFAULT = 60  # in seconds
+
 SETTINGS_USE_CACHE = "use_cache"
 SETTINGS_USE_CACHE_DEFAULT = True
 SETTINGS_USE_CUSTOM_CACHE = "use_custom_cache"
@@ -36,6 +43,10 @@ SETTINGS_USE_CUSTOM_CACHE_DEFAULT = False
 SETTINGS_CUSTOM_CACHE_PATH = "custom_cache"
 SETTINGS_CACHE_MAX_SIZE = "cache_max_size"
 SETTINGS_CACHE_MAX_SIZE_DEFAULT = 50 * 1024 * 1024  # in bytes
+SETTINGS_MEMORY_CACHE_MAX_SIZE = "memory_cache_max_size"
+SETTINGS_MEMORY_CACHE_MAX_SIZE_DEFAULT = 64 * 1024 * 1024  # in bytes
+SETTINGS_ZOOM_CACHE_MAX_SIZE = "zoom_cache_max_size"
+SETTINGS_ZOOM_CACHE_MAX_SIZE_DEFAULT = 64 * 1024 * 1024  # in bytes
 
 SETTINGS_RECENT_DOCUMENTS_SECTION = "RecentDocuments"
 
@@ -0,0 +1,118 @@
+import os
+import getpass
+import hashlib
+
+from PySide6.QtCore import QObject, QByteArray, Signal, qDebug
+from PySide6.QtNetwork import QAbstractSocket, QLocalServer, QLocalSocket
+
+CONNECT_TIMEOUT = 500  # in miliseconds, before the running instance is considered gone
+WRITE_TIMEOUT = 1000  # in miliseconds
+# Connection attempts before a server name in use is considered left over by a crash
+STALE_SERVER_CHECKS = 3
+
+
+def server_name(application_name):
+    """Name of the local socket, one per user and application"""
+    user = hashlib.md5("{}\0{}".format(getpass.getuser(), application_name).encode('utf-8')).hexdigest()
+    return "{}-{}".format("".join(c for c in application_name if c.isalnum()), user[:16])
+
+
+def is_running(name):
+    """
+    Whether an instance listens on name. The connection is closed without
+    sending anything, the instance ignores it.
+    """
+    for _ in range(STALE_SERVER_CHECKS):
+        socket = QLocalSocket()
+        socket.connectToServer(name)
+        if socket.waitForConnected(CONNECT_TIMEOUT):
+            socket.disconnectFromServer()
+            return True
+        # A busy instance may not accept in time, a crashed one refuses at once
+        if socket.error() != QLocalSocket.SocketTimeoutError:
+            return False
+    return False
+
+
+def forward_files(name, paths):
+    """
+    Sends paths to the instance listening on name. Returns False when no
+    instance is running. An empty list only brings the instance forward.
+    """
+    socket = QLocalSocket()
+    socket.connectToServer(name)
+    if not socket.waitForConnected(CONNECT_TIMEOUT):
+        return False
+
+    data = "".join(os.path.abspath(path) + "\n" for path in paths)
+    # A lone new line is sent without any path, the connection has to carry something
+    socket.write(QByteArray((data or "\n").encode('utf-8')))
+    socket.flush()
+    forwarded = socket.waitForBytesWritten(WRITE_TIMEOUT) or socket.bytesToWrite() == 0
+    socket.disconnectFromServer()
+    if socket.state() != QLocalSocket.UnconnectedState:
+        socket.waitForDisconnected(WRITE_TIMEOUT)
+    return forwarded
+
+
+class SingleInstanceServer(QObject):
+    """
+    Listens for later instances of the application, which forward the files
+    they were asked to open and exit instead of starting their own Qt and
+    PlantUML processes. A connection sends one path per line and is closed
+    once written, files_received is emitted with the paths.
+    """
+    files_received = Signal(list)
+
+    def __init__(self, name, parent=None):
+        super().__init__(parent)
+        self.name = name
+        self.buffers = {}
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.UserAccessOption)
+        self.server.newConnection.connect(self.on_new_connection)
+
+    def listen(self):
+        """
+        Returns False when the server could not be started, among others when
+        another instance started listening since forward_files() was called:
+        the files should then be forwarded to it.
+        """
+        # With access options set, the socket is created aside and renamed to
+        # the name, listen() would take it from the running instance
+        if is_running(self.name):
+            qDebug("single instance server not started: another instance is running")
+            return False
+
+        if self.server.listen(self.name):
+            return True
+
+        if self.server.serverError() == QAbstractSocket.AddressInUseError:
+            # Left over by an instance which crashed, nobody answers on it
+            QLocalServer.removeServer(self.name)
+            if self.server.listen(self.name):
+                return True
+
+        qDebug("single instance server not started: {}".format(self.server.errorString()))
+        return False
+
+    def on_new_connection(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            self.buffers[socket] = QByteArray()
+            socket.readyRead.connect(lambda s=socket: self.on_ready_read(s))
+            socket.disconnected.connect(lambda s=socket: self.on_disconnected(s))
+
+    def on_ready_read(self, socket):
+        self.buffers[socket].append(socket.readAll())
+
+    def on_disconnected(self, socket):
+        data = self.buffers.pop(socket, QByteArray())
+        data.append(socket.readAll())
+        socket.deleteLater()
+        if data.isEmpty():
+            # Checked by is_running()
+            return
+        paths = [line for line in bytes(data).decode('utf-8', 'replace').split("\n") if line]
+        qDebug("forwarded by another instance: {}".format(", ".join(paths)))
+        self.files_received.emit(paths)
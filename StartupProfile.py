@@ -0,0 +1,116 @@
+import builtins
+import sys
+import time
+
+# Nothing but the standard library is imported here, the profiler is
+# installed before the modules it measures
+
+STARTUP_TIME_TARGET = 1000  # in miliseconds, from the start of main.py to the first painted window
+REPORTED_IMPORTS = 25
+
+
+class StartupProfiler:
+    """
+    Measures the startup of the editor: how long importing every module
+    takes, without the modules it imports itself, and how long the steps
+    of the construction reported with stage() or wrapped by time_methods()
+    take.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last_stage = self.start
+        # module name -> [own time, total time], in seconds
+        self.imports = {}
+        # Time spent in the nested imports of the imports being measured
+        self.nested = []
+        self.stages = []
+        self.methods = []
+        self.original_import = builtins.__import__
+        builtins.__import__ = self.timed_import
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or (name in sys.modules and not fromlist):
+            return self.original_import(name, globals, locals, fromlist, level)
+
+        self.nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            total = time.perf_counter() - start
+            nested = self.nested.pop()
+            if self.nested:
+                self.nested[-1] += total
+            times = self.imports.setdefault(name, [0.0, 0.0])
+            times[0] += total - nested
+            times[1] += total
+
+    def stop(self):
+        builtins.__import__ = self.original_import
+
+    def stage(self, name):
+        """Ends the stage name, which started with the previous one"""
+        now = time.perf_counter()
+        self.stages.append((name, now - self.last_stage))
+        self.last_stage = now
+
+    def time_methods(self, cls, *names):
+        """Reports the time spent in the given methods of cls"""
+        for name in names:
+            method = getattr(cls, name)
+
+            def timed(*args, _method=method, _name="{}.{}".format(cls.__name__, name), **kwargs):
+                start = time.perf_counter()
+                try:
+                    return _method(*args, **kwargs)
+                finally:
+                    self.methods.append((_name, time.perf_counter() - start))
+
+            setattr(cls, name, timed)
+
+    def elapsed(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def report(self, stream=None):
+        stream = stream or sys.stderr
+        elapsed = self.elapsed()
+        imports = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)
+
+        print("imports (own time, with nested imports), {:.1f} ms in total:".format(
+            sum(times[0] for _, times in imports) * 1000), file=stream)
+        for name, (own, total) in imports[:REPORTED_IMPORTS]:
+            print("  {:8.1f} ms {:8.1f} ms  {}".format(own * 1000, total * 1000, name), file=stream)
+
+        print("stages:", file=stream)
+        for name, duration in self.stages:
+            print("  {:8.1f} ms  {}".format(duration * 1000, name), file=stream)
+        for name, duration in self.methods:
+            print("  {:8.1f} ms    {}".format(duration * 1000, name), file=stream)
+
+        print("time to first window: {:.1f} ms (target {} ms)".format(elapsed, STARTUP_TIME_TARGET), file=stream)
+        return elapsed
+
+    def report_after_first_paint(self, application):
+        """Reports once the first window is painted, then quits with 1 if it took longer than the target"""
+        from PySide6.QtCore import QObject, QEvent, QTimer
+
+        profiler = self
+
+        class FirstPaintFilter(QObject):
+            def eventFilter(self, watched, event):
+                if event.type() == QEvent.Paint:
+                    application.removeEventFilter(self)
+                    # Lets the rest of the frame be painted
+                    QTimer.singleShot(0, profiler.finish)
+                return False
+
+        self.application = application
+        self.paint_filter = FirstPaintFilter(application)
+        application.installEventFilter(self.paint_filter)
+
+    def finish(self):
+        self.stage("first paint")
+        self.stop()
+        elapsed = self.report()
+        self.application.exit(0 if elapsed <= STARTUP_TIME_TARGET else 1)
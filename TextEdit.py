@@ -1,12 +1,20 @@
-from PySide6.QtWidgets import QPlainTextEdit, QWidget, QApplication
-from PySide6.QtCore import QSize, QRect, qDebug, Qt
-from PySide6.QtGui import QPainter, QTextBlock, QTextCursor
+from PySide6.QtWidgets import QPlainTextEdit, QWidget, QApplication, QTextEdit, QToolTip
+from PySide6.QtCore import QSize, QRect, QEvent, qDebug, Qt
+from PySide6.QtGui import QPainter, QTextBlock, QTextCursor, QTextFormat, QColor
+
+from Highlighter import PlantUmlHighlighter
+
+MIN_LINE_NUMBER_DIGITS = 3
+LINE_NUMBER_MARGIN = 3  # in pixels
+PROBLEM_BACKGROUND_COLOR = QColor(255, 220, 220)
 
 
 class LineNumberArea(QWidget):
     def __init__(self, editor):
         super(LineNumberArea, self).__init__(editor)
         self.text_editor = editor
+        # Everything is painted by line_number_area_paint_event, the editor behind it does not need a repaint
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
 
     # Overrides
     def sizeHint(self):
@@ -24,7 +32,14 @@ class TextEdit(QPlainTextEdit):
         self._indent_with_space = False
         self._auto_indent = True
 
+        self.highlighter = PlantUmlHighlighter(self.document())
+
         self.line_number_area = LineNumberArea(self)
+        self._line_number_digits = 0
+        # (cursor, message) of the lines highlighted as problems
+        self._problems = []
+        self.update_metrics()
+        self.update_tab_stop_distance()
 
         self.blockCountChanged.connect(self.update_line_number_area_width)
         self.updateRequest.connect(self.update_line_number_area)
@@ -33,6 +48,7 @@ class TextEdit(QPlainTextEdit):
 
     def set_indent_size(self, indent_size):
         self._indent_size = indent_size
+        self.update_tab_stop_distance()
 
     def indent_size(self):
         return self._indent_size
@@ -49,42 +65,84 @@ class TextEdit(QPlainTextEdit):
     def auto_indent(self):
         return self._auto_indent
 
-    def line_number_area_paint_event(self, event):
+    def set_problems(self, problems):
+        """Highlights the lines of problems, a list of (line number, message) shown as tooltips"""
+        selections = []
+        self._problems = []
+        document = self.document()
+        for line, message in problems:
+            block = document.findBlockByNumber(line)
+            if not block.isValid():
+                continue
+
+            # The cursor follows the line while the document is edited
+            cursor = QTextCursor(block)
+            selection = QTextEdit.ExtraSelection()
+            selection.format.setBackground(PROBLEM_BACKGROUND_COLOR)
+            selection.format.setProperty(QTextFormat.FullWidthSelection, True)
+            selection.cursor = cursor
+            selections.append(selection)
+            self._problems.append((cursor, message))
+        self.setExtraSelections(selections)
+
+    def problems_at(self, position):
+        block_number = self.cursorForPosition(position).blockNumber()
+        return [message for cursor, message in self._problems if cursor.blockNumber() == block_number]
+
+    def update_metrics(self):
+        """Font metrics used by the line number area, updated when the font changes"""
+        metrics = self.fontMetrics()
+        self._line_height = metrics.height()
+        self._digit_width = metrics.horizontalAdvance('9')
 
+    def line_number_area_paint_event(self, event):
         painter = QPainter(self.line_number_area)
         painter.fillRect(event.rect(), Qt.lightGray)
+        painter.setPen(Qt.black)
+        painter.setFont(self.font())
+
+        event_top = event.rect().top()
+        event_bottom = event.rect().bottom()
+        width = self.line_number_area.width()
+        line_height = self._line_height
 
         block = QTextBlock(self.firstVisibleBlock())
         block_number = block.blockNumber()
         top = int(self.blockBoundingGeometry(block).translated(self.contentOffset()).top())
-        bottom = top + int(self.blockBoundingRect(block).height())
-
-        while block.isValid() and top <= event.rect().bottom():
-            if block.isVisible() and bottom >= event.rect().top():
-                number = str(block_number + 1)
-                painter.setPen(Qt.black)
-                painter.drawText(0, top, self.line_number_area.width(),
-                                 self.fontMetrics().height(), Qt.AlignRight, number)
+        while block.isValid() and top <= event_bottom:
+            bottom = top + int(self.blockBoundingRect(block).height())
+            if block.isVisible() and bottom >= event_top:
+                painter.drawText(0, top, width, line_height, Qt.AlignRight, str(block_number + 1))
 
             block = block.next()
             top = bottom
-            bottom = top + int(self.blockBoundingRect(block).height())
             block_number += 1
 
-    def line_number_area_width(self):
-        digits = 1
-        maximum = max(1, self.blockCount())
-        while maximum >= 10:
-            maximum /= 10
-            digits += 1
-
-        digits = max(3, digits)
+    def update_tab_stop_distance(self):
+        # Setting the distance lays the whole document out again, only do it when it changes
+        indent_line = ' ' * self.indent_size()
+        distance = self.fontMetrics().tightBoundingRect(indent_line).width()
+        if distance != self.tabStopDistance():
+            self.setTabStopDistance(distance)
 
-        space = 3 + self.fontMetrics().boundingRect('9').width() * digits
+    def line_number_digits(self):
+        return max(MIN_LINE_NUMBER_DIGITS, len(str(max(1, self.blockCount()))))
 
-        return space
+    def line_number_area_width(self):
+        return LINE_NUMBER_MARGIN + self._digit_width * self.line_number_digits()
 
     # Overrides
+    def event(self, event):
+        if event.type() == QEvent.ToolTip and self._problems:
+            position = self.viewport().mapFromGlobal(event.globalPos())
+            messages = self.problems_at(position)
+            if messages:
+                QToolTip.showText(event.globalPos(), "\n".join(messages), self)
+            else:
+                QToolTip.hideText()
+            return True
+        return super(TextEdit, self).event(event)
+
     def keyPressEvent(self, key_event):
         key = key_event.key()
 
@@ -128,47 +186,54 @@ class TextEdit(QPlainTextEdit):
             selection_start = current_text_cursor.selectionStart()
             selection_end = current_text_cursor.selectionEnd()
 
+            # A single undo step and change notification, however many lines are (un)indented
+            current_text_cursor.beginEditBlock()
             if selection_start == selection_end:
                 if not (modifiers & Qt.ShiftModifier):
                     current_text_cursor.insertText(indent_line)
                 else:
-                    current_text_cursor.setPosition(current_text_cursor.block().position())
-                    text = current_text_cursor.block().text()
-                    for i in range(0, min(len(indent_line), len(text))):
-                        if not text[i].isspace():
-                            break
-
-                        current_text_cursor.deleteChar()
+                    self.unindent_block(current_text_cursor, current_text_cursor.block(), indent_line)
 
             else:
                 text_block = QTextBlock(self.document().findBlock(selection_start))
 
                 while text_block.isValid() and text_block.position() <= selection_end:
-                    current_text_cursor.setPosition(text_block.position())
-
                     if not (modifiers & Qt.ShiftModifier):
+                        current_text_cursor.setPosition(text_block.position())
                         current_text_cursor.insertText(indent_line)
                         selection_end += len(indent_line)
                     else:
-                        qDebug("<<<")
-                        text = current_text_cursor.block().text()
-                        for i in range(0, min(len(indent_line), len(text))):
-                            if not text[i].isspace():
-                                break
-
-                            current_text_cursor.deleteChar()
-                            selection_end -= 1
+                        selection_end -= self.unindent_block(current_text_cursor, text_block, indent_line)
 
                     text_block = text_block.next()
+            current_text_cursor.endEditBlock()
 
         else:
             super(TextEdit, self).keyPressEvent(key_event)
 
-    def paintEvent(self, paint_event):
-        # Update tab stops
-        indent_line = ' ' * self.indent_size()
-        self.setTabStopDistance(self.fontMetrics().tightBoundingRect(indent_line).width())
-        super(TextEdit, self).paintEvent(paint_event)
+    def unindent_block(self, cursor, block, indent_line):
+        """Removes up to one indent_line of leading white spaces from block, returns how many"""
+        text = block.text()
+        count = 0
+        while count < min(len(indent_line), len(text)) and text[count].isspace():
+            count += 1
+
+        if count:
+            cursor.setPosition(block.position())
+            cursor.setPosition(block.position() + count, QTextCursor.KeepAnchor)
+            cursor.removeSelectedText()
+        return count
+
+    def changeEvent(self, event):
+        super(TextEdit, self).changeEvent(event)
+        if event.type() == QEvent.FontChange:
+            self.update_metrics()
+            self._line_number_digits = 0
+            self.update_line_number_area_width(0)
+            self.update_tab_stop_distance()
+        elif event.type() == QEvent.DevicePixelRatioChange:
+            # Font metrics are rounded differently on another screen
+            self.update_tab_stop_distance()
 
     def resizeEvent(self, resize_event):
         super(TextEdit, self).resizeEvent(resize_event)
@@ -177,7 +242,11 @@ class TextEdit(QPlainTextEdit):
 
     # Slots
     def update_line_number_area_width(self, _):
-        self.setViewportMargins(self.line_number_area_width(), 0, 0, 0)
+        # The width only depends on the number of digits of the line count
+        digits = self.line_number_digits()
+        if digits != self._line_number_digits:
+            self._line_number_digits = digits
+            self.setViewportMargins(self.line_number_area_width(), 0, 0, 0)
 
     def update_line_number_area(self, rect, dy):
         if dy:
@@ -0,0 +1,120 @@
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem
+from PySide6.QtWidgets import QPushButton, QFileDialog, QHeaderView
+from PySide6.QtGui import QPainter
+from PySide6.QtCore import QRect, Qt, QT_TRANSLATE_NOOP, qDebug
+
+from RenderTiming import STAGES, STAGE_TOTAL
+
+HISTOGRAM_BINS = 20
+HISTOGRAM_HEIGHT = 80
+
+STAGE_NAMES = {
+    "hash": QT_TRANSLATE_NOOP("TimingWindow", "Hashing"),
+    "cache_lookup": QT_TRANSLATE_NOOP("TimingWindow", "Cache lookup"),
+    "spawn": QT_TRANSLATE_NOOP("TimingWindow", "Process spawn"),
+    "first_byte": QT_TRANSLATE_NOOP("TimingWindow", "First byte"),
+    "render": QT_TRANSLATE_NOOP("TimingWindow", "Render"),
+    "decode": QT_TRANSLATE_NOOP("TimingWindow", "Decode"),
+    "paint": QT_TRANSLATE_NOOP("TimingWindow", "Paint"),
+    "total": QT_TRANSLATE_NOOP("TimingWindow", "Total"),
+}
+STATISTICS_COLUMNS = ["last", "p50", "p95", "max", "count"]
+
+
+class HistogramWidget(QWidget):
+    def __init__(self, timing_log, stage, parent=None):
+        super().__init__(parent)
+        self.timing_log = timing_log
+        self.stage = stage
+        self.setMinimumHeight(HISTOGRAM_HEIGHT)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+
+        width, counts = self.timing_log.histogram(self.stage, HISTOGRAM_BINS)
+        highest = max(counts)
+        if not highest:
+            return
+
+        text_height = self.fontMetrics().height()
+        area = self.rect().adjusted(2, 2, -2, -text_height - 2)
+        bar_width = area.width() / HISTOGRAM_BINS
+        for i, count in enumerate(counts):
+            bar_height = int(area.height() * count / highest)
+            painter.fillRect(QRect(int(area.left() + i * bar_width), area.bottom() - bar_height,
+                                   max(1, int(bar_width) - 1), bar_height), Qt.darkCyan)
+
+        painter.setPen(Qt.black)
+        painter.drawText(QRect(0, area.bottom(), self.width(), text_height), Qt.AlignLeft, "0 ms")
+        painter.drawText(QRect(0, area.bottom(), self.width(), text_height), Qt.AlignRight,
+                         "%.0f ms" % (width * HISTOGRAM_BINS))
+
+
+class TimingWindow(QWidget):
+    """Rolling per-stage latency statistics of the refreshes"""
+
+    def __init__(self, timing_log, parent=None):
+        super().__init__(parent)
+        self.timing_log = timing_log
+
+        self.table = QTableWidget(len(STAGES), len(STATISTICS_COLUMNS), self)
+        self.table.setHorizontalHeaderLabels(STATISTICS_COLUMNS)
+        self.table.setVerticalHeaderLabels([self.tr(STAGE_NAMES[stage]) for stage in STAGES])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+
+        self.histogram = HistogramWidget(timing_log, STAGE_TOTAL, self)
+        self.histogram.setToolTip(self.tr("Distribution of the total refresh time"))
+
+        export_button = QPushButton(self.tr("Export..."), self)
+        export_button.clicked.connect(self.export)
+        clear_button = QPushButton(self.tr("Clear"), self)
+        clear_button.clicked.connect(self.timing_log.clear)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        buttons.addWidget(clear_button)
+        buttons.addWidget(export_button)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.table)
+        layout.addWidget(self.histogram)
+        layout.addLayout(buttons)
+
+        self.timing_log.changed.connect(self.update_statistics)
+        self.update_statistics()
+
+    def update_statistics(self):
+        if not self.isVisible():
+            return
+
+        for row, stage in enumerate(STAGES):
+            statistics = self.timing_log.statistics(stage)
+            for column, name in enumerate(STATISTICS_COLUMNS):
+                if statistics is None:
+                    text = ""
+                elif name == "count":
+                    text = str(statistics[name])
+                else:
+                    text = "%.1f" % statistics[name]
+                self.table.setItem(row, column, QTableWidgetItem(text))
+
+        self.histogram.update()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_statistics()
+
+    def export(self):
+        file_name = QFileDialog.getSaveFileName(self,
+                                                self.tr("Export render timings"),
+                                                "render_timings.json",
+                                                "JSON (*.json);; All Files (*.*)")
+        file_name = file_name[0]
+        if not file_name:
+            return
+
+        qDebug("exporting render timings in: {}".format(file_name))
+        with open(file_name, 'w', encoding='utf-8') as f:
+            f.write(self.timing_log.to_json())
@@ -1,8 +1,37 @@
-from PyQt5.QtCore import QT_TRANSLATE_NOOP
+import os
+import re
+import hashlib
+
+from PySide6.QtCore import QT_TRANSLATE_NOOP, QStandardPaths
 
 CACHE_SCALE = 1024 * 1024
+# File names make_fingerprint_key() generates, anything else in a cache directory is not ours
+CACHE_KEY_PATTERN = re.compile(r"^[0-9a-f]{32}\.(?:png|svg)$")
 
 
 def cache_size_to_string(size):
-    return QT_TRANSLATE_NOOP("%0.2f Mb") % (size / CACHE_SCALE)
+    return QT_TRANSLATE_NOOP("Utils", "%0.2f Mb") % (size / CACHE_SCALE)
+
+
+def compute_md5_hash(my_string):
+    m = hashlib.md5()
+    m.update(my_string.encode('utf-8'))
+    return m.hexdigest()
+
+
+def make_fingerprint_key(fingerprint, format_name, dependencies=""):
+    """
+    Cache key of the diagram with the given fingerprint. dependencies
+    identifies the content of the files it includes (see DependencyGraph).
+    """
+    if dependencies:
+        fingerprint = compute_md5_hash("%s\0%s" % (fingerprint, dependencies))
+    return "%s.%s" % (fingerprint, format_name)
+
+
+def is_cache_key(name):
+    return CACHE_KEY_PATTERN.match(name) is not None
+
 
+def default_cache_path():
+    return os.path.join(QStandardPaths.writableLocation(QStandardPaths.CacheLocation), "images")
@@ -0,0 +1,80 @@
+import threading
+
+from PySide6.QtCore import QRect, QRectF, Qt
+from PySide6.QtGui import QImage, QPainter
+
+MIN_PYRAMID_LEVEL_SIZE = 64  # in pixels, smallest side of the coarsest level
+
+
+def scale_tile(level, level_scale, zoom, tile_rect, smooth):
+    """Renders tile_rect (in zoomed coordinates) of an image from one of its pyramid levels"""
+    factor = level_scale / zoom
+    source = QRectF(tile_rect.x() * factor, tile_rect.y() * factor,
+                    tile_rect.width() * factor, tile_rect.height() * factor)
+
+    tile = QImage(tile_rect.size(), QImage.Format_ARGB32_Premultiplied)
+    tile.fill(Qt.transparent)
+    painter = QPainter(tile)
+    painter.setRenderHint(QPainter.SmoothPixmapTransform, smooth)
+    painter.drawImage(QRectF(0, 0, tile_rect.width(), tile_rect.height()), level, source)
+    painter.end()
+    return tile
+
+
+class ZoomPyramid:
+    """
+    Multi-resolution (mipmap) levels of an image: level n is the image scaled
+    by 1/2^n. Levels are built on demand, as long as they fit in max_cost.
+    Building happens in the background tasks refining tiles, the GUI thread uses
+    the levels which already exist.
+    """
+
+    def __init__(self, image, max_cost):
+        self.levels = [image]
+        self.max_cost = max_cost
+        self.cost = 0
+        self.lock = threading.Lock()
+
+    def level_for(self, zoom, build=True):
+        """Smallest level still at least as large as the zoomed image, with its scale"""
+        level_scale = 1.0
+        index = 0
+        while zoom <= level_scale / 2 and self.has_level(index + 1, build):
+            index += 1
+            level_scale /= 2
+        return self.levels[index], level_scale
+
+    def has_level(self, index, build):
+        if index < len(self.levels):
+            return True
+        if not build:
+            return False
+
+        with self.lock:
+            return self.ensure_level(index)
+
+    def ensure_level(self, index):
+        if index < len(self.levels):
+            return True
+
+        previous = self.levels[-1]
+        if min(previous.width(), previous.height()) < 2 * MIN_PYRAMID_LEVEL_SIZE:
+            return False
+
+        cost = previous.sizeInBytes() // 4
+        if self.cost + cost > self.max_cost:
+            return False
+
+        self.levels.append(previous.scaled(previous.width() // 2, previous.height() // 2,
+                                           Qt.IgnoreAspectRatio, Qt.SmoothTransformation))
+        self.cost += cost
+        return True
+
+
+def refine_tiles(pyramid, zoom, tiles):
+    """
+    Smoothly scaled versions of draft tiles, meant to run in a worker thread.
+    tiles is a list of (tile key, (x, y, width, height)).
+    """
+    level, level_scale = pyramid.level_for(zoom)
+    return [(key, scale_tile(level, level_scale, zoom, QRect(*tile_rect), True)) for key, tile_rect in tiles]
@@ -0,0 +1,155 @@
+import random
+import sys
+import time
+
+from PySide6.QtGui import QTextCursor, QTextDocument
+from PySide6.QtWidgets import QApplication, QPlainTextDocumentLayout
+
+from Fingerprint import DocumentFingerprint, combine_digests, line_digest, split_lines
+from Highlighter import PlantUmlHighlighter
+from RenderTiming import percentile
+from TextEdit import TextEdit
+from Utils import compute_md5_hash
+
+# Compares the optimized code paths of the editor with the naive ones:
+#
+#     python benchmarks.py [fingerprint] [editor] [highlighter]
+
+
+def benchmark_fingerprint(size=4 * 1024 * 1024, edits=200):
+    """Compares the per-keystroke cost of hashing the full text and of the incremental fingerprint"""
+    diagram = "@startuml\n" + "".join("participant P{0}\nP{0} -> P{1}: message {0}\n".format(i, i + 1)
+                                      for i in range(40)) + "@enduml\n\n"
+    text = diagram * (size // len(diagram) + 1)
+
+    # The same edits are made in a plain document and in a fingerprinted one
+    plain = QTextDocument()
+    plain.setDocumentLayout(QPlainTextDocumentLayout(plain))
+    plain.setPlainText(text)
+    document = QTextDocument()
+    document.setDocumentLayout(QPlainTextDocumentLayout(document))
+    document.setPlainText(text)
+
+    start = time.perf_counter()
+    fingerprint = DocumentFingerprint(document)
+    build = time.perf_counter() - start
+
+    random.seed(0)
+    plain_cursor = QTextCursor(plain)
+    cursor = QTextCursor(document)
+    full, incremental = 0.0, 0.0
+    for _ in range(edits):
+        position = random.randrange(document.characterCount() - 1)
+        edit = random.choice(["x", "\n", "A -> B\n"])
+
+        start = time.perf_counter()
+        plain_cursor.setPosition(position)
+        plain_cursor.insertText(edit)
+        [compute_md5_hash("\n".join(block)) for block in split_lines(plain.toPlainText())]
+        full += time.perf_counter() - start
+
+        start = time.perf_counter()
+        cursor.setPosition(position)
+        cursor.insertText(edit)
+        fingerprint.diagrams()
+        incremental += time.perf_counter() - start
+
+    expected = [combine_digests([line_digest(line) for line in block])
+                for block in split_lines(document.toPlainText())]
+    assert [d.fingerprint for d in fingerprint.diagrams()] == expected
+
+    print("document: {:.1f} MB, {} lines, {} diagrams".format(
+        document.characterCount() / 1024 / 1024, document.blockCount(), len(expected)))
+    print("initial fingerprint:      {:8.2f} ms".format(build * 1000))
+    print("full text MD5 per edit:   {:8.2f} ms".format(full * 1000 / edits))
+    print("incremental per edit:     {:8.2f} ms".format(incremental * 1000 / edits))
+
+
+def benchmark_editor(lines=50000, frames=1000):
+    """Scrolls through a long document, reports the paint times of the editor and of its line numbers"""
+    editor = TextEdit(None)
+    editor.resize(800, 1000)
+    editor.show()
+    editor.setPlainText("".join("A{0} -> B{0}: message {0}\n".format(i) for i in range(lines)))
+    QApplication.processEvents()
+
+    # Mouse wheel like steps of three lines from the middle of the document
+    scroll_bar = editor.verticalScrollBar()
+    first = scroll_bar.maximum() // 2
+    gutter_times, frame_times = [], []
+    for value in range(first, min(scroll_bar.maximum(), first + 3 * frames), 3):
+        scroll_bar.setValue(value)
+        start = time.perf_counter()
+        editor.line_number_area.repaint()
+        gutter_times.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        editor.viewport().repaint()
+        frame_times.append((time.perf_counter() - start) * 1000)
+
+    print("document: {} lines, {} frames".format(editor.blockCount(), len(frame_times)))
+    for name, times in (("line numbers", gutter_times), ("editor", frame_times)):
+        print("{:13} p50 {:6.2f} ms  p95 {:6.2f} ms  max {:6.2f} ms".format(
+            name, percentile(times, 50), percentile(times, 95), max(times)))
+
+
+class CountingHighlighter(PlantUmlHighlighter):
+    calls = 0
+
+    def highlightBlock(self, text):
+        self.calls += 1
+        super().highlightBlock(text)
+
+
+def benchmark_highlighter(sizes=(1000, 10000, 100000), keystrokes=200):
+    """Per-keystroke highlighting cost for growing documents, it should not depend on their size"""
+    diagram = ("@startuml\n"
+               "participant Alice #lightblue\n"
+               "' a comment\n"
+               "Alice -> Bob: \"hello\"\n"
+               "note left\n"
+               "  a multi-line note\n"
+               "end note\n"
+               "/' a block\n"
+               "   comment '/\n"
+               "alt success\n"
+               "  Bob --> Alice: ok\n"
+               "end\n"
+               "@enduml\n")
+    lines_per_diagram = diagram.count("\n")
+
+    for size in sizes:
+        document = QTextDocument()
+        document.setDocumentLayout(QPlainTextDocumentLayout(document))
+        document.setPlainText(diagram * (size // lines_per_diagram))
+        highlighter = CountingHighlighter(document)
+        start = time.perf_counter()
+        # Otherwise the first highlighting waits for the event loop
+        highlighter.rehighlight()
+        initial = (time.perf_counter() - start) * 1000
+        highlighter.calls = 0
+
+        cursor = QTextCursor(document)
+        cursor.setPosition(document.findBlockByNumber(document.blockCount() // 2 + 3).position())
+        times = []
+        for i in range(keystrokes):
+            start = time.perf_counter()
+            cursor.insertText("x" if i % 10 else " ")
+            times.append((time.perf_counter() - start) * 1000)
+
+        print("{:7} lines: initial {:8.1f} ms, per keystroke p50 {:6.3f} ms p95 {:6.3f} ms, "
+              "{:.1f} lines highlighted".format(document.blockCount(), initial, percentile(times, 50),
+                                                percentile(times, 95), highlighter.calls / keystrokes))
+
+
+BENCHMARKS = {
+    "fingerprint": benchmark_fingerprint,
+    "editor": benchmark_editor,
+    "highlighter": benchmark_highlighter,
+}
+
+
+if __name__ == "__main__":
+    application = QApplication(sys.argv[:1])
+    for name in sys.argv[1:] or list(BENCHMARKS):
+        print("{}:".format(name))
+        BENCHMARKS[name]()
@@ -1,16 +1,23 @@
 import sys
+
+from StartupProfile import StartupProfiler
+
+PROFILE_STARTUP_OPTION = "--profile-startup"
+# Installed before anything else is imported, so that every import is measured
+startup_profiler = StartupProfiler() if PROFILE_STARTUP_OPTION in sys.argv[1:] else None
+
 import os
 
-from PySide6.QtCore import QSettings, qDebug
+from PySide6.QtCore import QSettings, QCoreApplication, qDebug
 from PySide6.QtWidgets import QApplication
 from PySide6.QtGui import QIcon
 
 from XDG import get_xdr_data_home, get_xdr_data_dirs
-
-from MainWindow import MainWindow
+from SingleInstance import SingleInstanceServer, forward_files, server_name
 
 APPLICATION_NAME = "Diagram Editor"
 ORGANIZATION_NAME = "mauricekoster.com"
+NEW_INSTANCE_OPTION = "--new-instance"
 
 
 def resource_path(path):
@@ -23,6 +30,29 @@ def resource_path(path):
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        from BatchRender import run_batch
+
+        app = QCoreApplication(sys.argv)
+        app.setApplicationName(APPLICATION_NAME)
+        app.setOrganizationName(ORGANIZATION_NAME)
+        sys.exit(run_batch(sys.argv[2:]))
+
+    # Files opened while the editor runs go to the running instance, which
+    # already paid for Qt and the PlantUML process
+    new_instance = NEW_INSTANCE_OPTION in sys.argv[1:] or startup_profiler is not None
+    paths = [argument for argument in sys.argv[1:] if not argument.startswith("-")]
+    instance_name = server_name(APPLICATION_NAME)
+    if not new_instance and forward_files(instance_name, paths):
+        sys.exit(0)
+
+    from MainWindow import MainWindow
+
+    if startup_profiler is not None:
+        startup_profiler.stage("imports")
+        startup_profiler.time_methods(MainWindow, "create_dock_windows", "create_actions", "create_menus",
+                                      "create_tool_bars", "create_status_bar", "read_settings", "open_documents")
+
     print(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'icons'))
     d = []
     d.extend([os.path.join(d, '.icons') for d in get_xdr_data_home()])
@@ -35,10 +65,23 @@ if __name__ == '__main__':
     app = QApplication(sys.argv)
     app.setApplicationName(APPLICATION_NAME)
     app.setOrganizationName(ORGANIZATION_NAME)
+    if startup_profiler is not None:
+        startup_profiler.stage("QApplication")
+
+    instance_server = None
+    if not new_instance:
+        instance_server = SingleInstanceServer(instance_name, app)
+        # Another instance may have started listening since the files were forwarded
+        if not instance_server.listen() and forward_files(instance_name, paths):
+            sys.exit(0)
 
     # QSettings.setDefaultFormat(QSettings.IniFormat)
 
     w = MainWindow()
-    w.new_document()
-    w.show()
+    if instance_server is not None:
+        instance_server.files_received.connect(w.open_documents)
+    w.open_documents(paths)
+    if startup_profiler is not None:
+        startup_profiler.stage("MainWindow")
+        startup_profiler.report_after_first_paint(app)
     sys.exit(app.exec_())